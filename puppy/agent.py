@@ -7,7 +7,13 @@ from .run_type import RunMode
 from .memorydb import BrainDB
 from .portfolio import Portfolio
 from abc import ABC, abstractmethod
-from .chat import ChatOpenAICompatible
+from .chat import (
+    ChatOpenAICompatible,
+    http_client_keys,
+    response_cache_keys,
+    rate_limit_keys,
+    token_provider_keys,
+)
 from .environment import market_info_type
 from typing import Dict, Union, Any, List
 from .reflection import trading_reflection
@@ -142,12 +148,22 @@ class LLMAgent(Agent):
             self.truncator = TextTruncator(
                 tokenization_model_name=chat_config["tokenization_model_name"]
             )
-        self.guardrail_endpoint = ChatOpenAICompatible(
+        chat_client_params = {
+            k: chat_config.pop(k)
+            for k in http_client_keys
+            + response_cache_keys
+            + rate_limit_keys
+            + token_provider_keys
+            if k in chat_config
+        }
+        self.chat = ChatOpenAICompatible(
             end_point=end_point,
             model=model,
             system_message=system_message,
             other_parameters=chat_config,
-        ).guardrail_endpoint()
+            **chat_client_params,
+        )
+        self.guardrail_endpoint = self.chat.guardrail_endpoint()
         # records
         self.reflection_result_series_dict = {}
         self.access_counter = {}
@@ -164,32 +180,54 @@ class LLMAgent(Agent):
             look_back_window_size=config["general"]["look_back_window_size"],
         )
 
-    def _handling_filings(self, cur_date: date, filing_q: str, filing_k: str) -> None:
+    def _handling_filings(
+        self,
+        cur_date: date,
+        filing_q: str,
+        filing_k: str,
+        cur_emb: Union[Dict[str, Any], None] = None,
+    ) -> None:
+        cur_emb = cur_emb or {}
         if filing_q:
             self.brain.add_memory_mid(
-                symbol=self.trading_symbol, date=cur_date, text=filing_q
+                symbol=self.trading_symbol,
+                date=cur_date,
+                text=filing_q,
+                emb=cur_emb.get("filing_q"),
             )
         if filing_k:
             self.brain.add_memory_long(
                 symbol=self.trading_symbol,
                 date=cur_date,
                 text=filing_k,
+                emb=cur_emb.get("filing_k"),
             )
 
-    def _handling_news(self, cur_date: date, news: List[str]) -> None:
+    def _handling_news(
+        self,
+        cur_date: date,
+        news: List[str],
+        cur_emb: Union[Dict[str, Any], None] = None,
+    ) -> None:
+        cur_emb = cur_emb or {}
         if news != {}:
             self.brain.add_memory_short(
-                symbol=self.trading_symbol, date=cur_date, text=news
+                symbol=self.trading_symbol,
+                date=cur_date,
+                text=news,
+                emb=cur_emb.get("news"),
             )
     
     def __query_info_for_reflection(self, run_mode: RunMode):
         # sourcery skip: low-code-quality
         self.logger.info(f"Symbol: {self.trading_symbol}\n")
-        cur_short_queried, cur_short_memory_id = self.brain.query_short(
+        # one embedding of the character string for all four layers
+        queried = self.brain.query_all(
             query_text=self.character_string,
             top_k=self.top_k,
             symbol=self.trading_symbol,
         )
+        cur_short_queried, cur_short_memory_id = queried["short"]
         if self.model_name.startswith("tgi"):
             cur_short_queried_truc, cur_short_num_tokens = (
                 self.truncator.process_list_of_texts(
@@ -208,11 +246,7 @@ class LLMAgent(Agent):
             for cur_id, cur_memory in zip(cur_short_memory_id, cur_short_queried):
                 self.logger.info(f"Top-k Short: {cur_id}: {cur_memory}\n")
 
-        cur_mid_queried, cur_mid_memory_id = self.brain.query_mid(
-            query_text=self.character_string,
-            top_k=self.top_k,
-            symbol=self.trading_symbol,
-        )
+        cur_mid_queried, cur_mid_memory_id = queried["mid"]
         if self.model_name.startswith("tgi"):
             cur_mid_queried_truc, cur_mid_num_tokens = (
                 self.truncator.process_list_of_texts(
@@ -229,11 +263,7 @@ class LLMAgent(Agent):
             for cur_id, cur_memory in zip(cur_mid_memory_id, cur_mid_queried):
                 self.logger.info(f"Top-k Mid: {cur_id}: {cur_memory}\n")
 
-        cur_long_queried, cur_long_memory_id = self.brain.query_long(
-            query_text=self.character_string,
-            top_k=self.top_k,
-            symbol=self.trading_symbol,
-        )
+        cur_long_queried, cur_long_memory_id = queried["long"]
         if self.model_name.startswith("tgi"):
             cur_long_queried_truc, cur_long_num_tokens = (
                 self.truncator.process_list_of_texts(
@@ -252,14 +282,7 @@ class LLMAgent(Agent):
             for cur_id, cur_memory in zip(cur_long_memory_id, cur_long_queried):
                 self.logger.info(f"Top-k Long: {cur_id}: {cur_memory}\n")
 
-        (
-            cur_reflection_queried,
-            cur_reflection_memory_id,
-        ) = self.brain.query_reflection(
-            query_text=self.character_string,
-            top_k=self.top_k,
-            symbol=self.trading_symbol,
-        )
+        cur_reflection_queried, cur_reflection_memory_id = queried["reflection"]
         if self.model_name.startswith("tgi"):
             cur_reflection_queried_truc, cur_reflection_num_tokens = (
                 self.truncator.process_list_of_texts(
@@ -577,12 +600,13 @@ class LLMAgent(Agent):
         cur_filing_q = market_info[3]
         cur_news = market_info[4]
         cur_record = market_info[5] if run_mode == RunMode.Train else None
+        cur_emb = market_info[6]
         # 1. handling filings
         self._handling_filings(
-            cur_date=cur_date, filing_q=cur_filing_q, filing_k=cur_filing_k  # type: ignore
+            cur_date=cur_date, filing_q=cur_filing_q, filing_k=cur_filing_k, cur_emb=cur_emb  # type: ignore
         )
         # 2. handling news
-        self._handling_news(cur_date=cur_date, news=cur_news)
+        self._handling_news(cur_date=cur_date, news=cur_news, cur_emb=cur_emb)
         # 3. update the price to portfolio
         self.portfolio.update_market_info(
             new_market_price_info=cur_price,
@@ -593,6 +617,11 @@ class LLMAgent(Agent):
             run_mode=run_mode,
             cur_record=cur_record,
         )
+        self.logger.info(f"LLM connections: {self.chat.connection_stats()}")
+        if self.chat.response_cache is not None:
+            self.logger.info(f"LLM response cache: {self.chat.response_cache.info()}")
+        if self.chat.rate_limiter is not None:
+            self.logger.info(f"LLM rate limiter: {self.chat.rate_limiter.stats()}")
         # 5. construct actions
         if run_mode == RunMode.Train:
             cur_action = self._construct_train_actions(
@@ -633,8 +662,17 @@ class LLMAgent(Agent):
             pickle.dump(state_dict, f)
         self.brain.save_checkpoint(path=os.path.join(path, "brain"), force=force)
 
+    def close(self) -> None:
+        """Closes the LLM client's connection pool and response cache."""
+        self.chat.close()
+
     @classmethod
-    def load_checkpoint(cls, path: str) -> "LLMAgent":
+    def load_checkpoint(
+        cls, path: str, previous: Union["LLMAgent", None] = None
+    ) -> "LLMAgent":
+        """Loads an agent, closing the client of `previous` when it replaces one."""
+        if previous is not None:
+            previous.close()
         # load state dict
         with open(os.path.join(path, "state_dict.pkl"), "rb") as f:
             state_dict = pickle.load(f)
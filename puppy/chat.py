@@ -1,13 +1,52 @@
 import os
 import json
-import subprocess
+import asyncio
+import weakref
+import logging
+import importlib.util
 from abc import ABC
-from typing import Callable, Union, Dict, Any
+from typing import Awaitable, Callable, Union, Dict, Any, List, Tuple
 from dotenv import load_dotenv
 
 import httpx
 
+from .together_chat import TogetherChat
+from .llm_cache import LLMResponseCache, LLMCacheMissError
+from .rate_limit import RateLimiter, get_rate_limiter
+from .token_provider import TokenProvider, get_token_provider
+
 load_dotenv(dotenv_path=".env")
+logger = logging.getLogger(__name__)
+
+# keys of the [chat] config that configure the HTTP client, not the request payload
+http_client_keys = [
+    "timeout",
+    "max_connections",
+    "max_keepalive_connections",
+    "keepalive_expiry",
+    "http2",
+]
+# keys of the [chat] config that configure the response cache
+response_cache_keys = [
+    "response_cache_path",
+    "response_cache_max_entries",
+    "response_cache_ttl_seconds",
+    "response_cache_only",
+]
+# keys of the [chat] config that configure the per-process rate limiter
+rate_limit_keys = [
+    "requests_per_minute",
+    "tokens_per_minute",
+    "max_concurrency",
+    "max_retries",
+    "retry_deadline_seconds",
+]
+# keys of the [chat] config that configure where gemini access tokens come from
+token_provider_keys = [
+    "token_file",
+    "token_command",
+    "token_lifetime_seconds",
+]
 
 class LongerThanContextError(Exception):
     pass
@@ -36,6 +75,18 @@ class ChatOpenAICompatible(ABC):
     - Gemini Pro
     - TGI (LLaMA-style)
     - Together API (DeepSeek or other hosted LLMs)
+
+    Requests go through one long-lived httpx.Client with keep-alive and bounded pool
+    limits, using HTTP/2 when the `h2` package is installed (or `http2` says so).
+    Close it with `close()` or use the object as a context manager.
+    With `response_cache_path` set, responses are cached on disk by model and request
+    payload (see LLMResponseCache), so a repeated run reissues no identical request.
+    Gemini access tokens come from a TokenProvider (gcloud by default, or `token_file`)
+    that caches and refreshes them.
+    Any of the rate limit settings puts requests through a RateLimiter shared by all
+    clients of the same endpoint, with rate buckets, AIMD concurrency and retries.
+    `async_guardrail_endpoint` does the same on an httpx.AsyncClient per event loop,
+    `aclose()` on a loop closes the sync client and that loop's async one.
     """
 
     def __init__(
@@ -44,23 +95,72 @@ class ChatOpenAICompatible(ABC):
         model="gemini-pro",
         system_message: str = "You are a helpful assistant.",
         other_parameters: Union[Dict[str, Any], None] = None,
-        together_script_path : str = "together_chat.py",
-        together_venv_path: str = "venv_together",
+        timeout: float = 600.0,
+        max_connections: int = 10,
+        max_keepalive_connections: int = 5,
+        keepalive_expiry: float = 30.0,
+        http2: Union[bool, None] = None,  # None: use HTTP/2 if h2 is installed
+        response_cache_path: Union[str, None] = None,
+        response_cache_max_entries: int = 100_000,
+        response_cache_ttl_seconds: Union[float, None] = None,
+        response_cache_only: bool = False,
+        requests_per_minute: Union[float, None] = None,
+        tokens_per_minute: Union[float, None] = None,
+        max_concurrency: Union[int, None] = None,
+        max_retries: Union[int, None] = None,
+        retry_deadline_seconds: Union[float, None] = None,
+        token_file: Union[str, None] = None,
+        token_command: Union[List[str], None] = None,
+        token_lifetime_seconds: float = 3600.0,
+        token_provider: Union[TokenProvider, None] = None,
     ):
         api_key = os.environ.get("OPENAI_API_KEY", "-")
         self.end_point = end_point
         self.model = model
         self.system_message = system_message
-        self.together_script_path = together_script_path
-        self.together_venv_path =os.path.join(together_venv_path, "Scripts", "python.exe")
-        
+
         self.other_parameters = {} if other_parameters is None else other_parameters
+        if http2 is None:
+            http2 = importlib.util.find_spec("h2") is not None
+        self._client_params = {
+            "timeout": timeout,
+            "http2": http2,
+            "limits": httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+        }
+        self.client = httpx.Client(**self._client_params)
+        # created on first use by the async endpoint, with the same limits, one per
+        # event loop since an AsyncClient only works on the loop it first ran on
+        self._async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self.response_cache = (
+            LLMResponseCache(
+                path=response_cache_path,
+                max_entries=response_cache_max_entries,
+                ttl_seconds=response_cache_ttl_seconds,
+                cache_only=response_cache_only,
+            )
+            if response_cache_path is not None
+            else None
+        )
+        # connection reuse counters, see connection_stats
+        self.request_count = 0
+        self.new_connection_count = 0
+        self.last_http_version = None
 
+        # sets the Authorization header of every request when not None
+        self.token_provider = token_provider
         if model.startswith("gemini-pro"):
-            proc_result = subprocess.run(["gcloud", "auth", "print-access-token"], capture_output=True, text=True)
-            access_token = proc_result.stdout.strip()
+            # fetched on first use and refreshed in the background, shared across agents
+            if self.token_provider is None:
+                self.token_provider = get_token_provider(
+                    token_file=token_file,
+                    token_command=token_command,
+                    token_lifetime_seconds=token_lifetime_seconds,
+                )
             self.headers = {
-                "Authorization": f"Bearer {access_token}",
                 "Content-Type": "application/json",
             }
 
@@ -69,6 +169,16 @@ class ChatOpenAICompatible(ABC):
                 "Content-Type": "application/json"
             }
 
+        elif model.startswith("together"):
+            # "together-<together model name>", in-process on the shared client
+            self.together_chat = TogetherChat(
+                model=model[len("together-"):],
+                endpoint=end_point or None,
+                client=self.client,
+            )
+            self.end_point = self.together_chat.endpoint
+            self.headers = self.together_chat.headers
+
         elif model.startswith("deepseek"):
             self.headers = None
 
@@ -78,6 +188,133 @@ class ChatOpenAICompatible(ABC):
                 "Content-Type": "application/json",
             }
 
+        limiter_params = {
+            "requests_per_minute": requests_per_minute,
+            "tokens_per_minute": tokens_per_minute,
+            "max_concurrency": max_concurrency,
+            "max_retries": max_retries,
+            "deadline_seconds": retry_deadline_seconds,
+        }
+        limiter_params = {k: v for k, v in limiter_params.items() if v is not None}
+        self.rate_limiter: Union[RateLimiter, None] = (
+            get_rate_limiter(self.end_point, **limiter_params) if limiter_params else None
+        )
+
+    def close(self) -> None:
+        self.client.close()
+        if self.response_cache is not None:
+            self.response_cache.close()
+
+    async def aclose(self) -> None:
+        self.close()
+        async_client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if async_client is not None:
+            await async_client.aclose()
+
+    def __enter__(self) -> "ChatOpenAICompatible":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def connection_stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.request_count,
+            "new_connections": self.new_connection_count,
+            "reused_connections": self.request_count - self.new_connection_count,
+            "http_version": self.last_http_version,
+        }
+
+    def _post(self, payload: Dict[str, Any]) -> httpx.Response:
+        new_connection = []
+
+        def trace(event_name: str, info: Dict[str, Any]) -> None:
+            # only fired when the pool has no idle connection to the host
+            if event_name == "connection.connect_tcp.complete":
+                new_connection.append(True)
+
+        def send() -> httpx.Response:
+            return self.client.post(
+                self.end_point,
+                headers=self._request_headers(),
+                json=payload,
+                extensions={"trace": trace},
+            )
+
+        if self.rate_limiter is None:
+            response = send()
+        else:
+            response = self.rate_limiter.call(send, self._estimate_tokens(payload))
+        self.request_count += 1
+        self.new_connection_count += bool(new_connection)
+        self.last_http_version = response.http_version
+        logger.debug(
+            f"{self.end_point} {response.http_version} "
+            f"{'new' if new_connection else 'reused'} connection, {self.connection_stats()}"
+        )
+        return response
+
+    def _request_headers(self, token: Union[str, None] = None) -> Union[Dict[str, str], None]:
+        if self.token_provider is None:
+            return self.headers
+        if token is None:
+            token = self.token_provider.get_token()
+        return {
+            **(self.headers or {}),
+            "Authorization": f"Bearer {token}",
+        }
+
+    @staticmethod
+    def _estimate_tokens(payload: Dict[str, Any]) -> int:
+        # about four characters per token for the prompt, plus the completion budget
+        completion = (
+            payload.get("max_tokens")
+            or payload.get("parameters", {}).get("max_new_tokens")
+            or payload.get("generation_config", {}).get("max_output_tokens")
+            or 0
+        )
+        return len(json.dumps(payload)) // 4 + completion
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        async_client = self._async_clients.get(loop)
+        if async_client is None:
+            async_client = httpx.AsyncClient(**self._client_params)
+            self._async_clients[loop] = async_client
+        return async_client
+
+    async def _apost(self, payload: Dict[str, Any]) -> httpx.Response:
+        new_connection = []
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            if event_name == "connection.connect_tcp.complete":
+                new_connection.append(True)
+
+        async def send() -> httpx.Response:
+            token = None
+            if self.token_provider is not None:
+                # a refresh may run gcloud, keep it off the event loop
+                token = await asyncio.to_thread(self.token_provider.get_token)
+            return await self._get_async_client().post(
+                self.end_point,
+                headers=self._request_headers(token),
+                json=payload,
+                extensions={"trace": trace},
+            )
+
+        if self.rate_limiter is None:
+            response = await send()
+        else:
+            response = await self.rate_limiter.acall(send, self._estimate_tokens(payload))
+        self.request_count += 1
+        self.new_connection_count += bool(new_connection)
+        self.last_http_version = response.http_version
+        logger.debug(
+            f"{self.end_point} {response.http_version} "
+            f"{'new' if new_connection else 'reused'} connection, {self.connection_stats()}"
+        )
+        return response
+
     def parse_response(self, response: httpx.Response) -> str:
         """
         Parse API responses into plain text depending on model type.
@@ -91,99 +328,120 @@ class ChatOpenAICompatible(ABC):
         elif self.model.startswith("tgi"):
             return response.json()["generated_text"]
 
+        elif self.model.startswith("together"):
+            return self.together_chat.parse_response(response)
+
         else:
             raise NotImplementedError(f"Model {self.model} not implemented")
 
-    def run_together_subprocess(self, prompt: str) -> str:
-        try:
-            
-            env = os.environ.copy()
-            env["TOGETHER_API_KEY"] = os.environ.get("TOGETHER_API_KEY", "")
-            result = subprocess.run(
-                [r"D:\Data science research\FinMem-LLM-StockTrading\venv_together\Scripts\python.exe", r"D:\Data science research\FinMem-LLM-StockTrading\puppy\together_chat.py"],
-                input=json.dumps([
-    {"role": "system", "content": "You are a helpful assistant only capable of communicating with valid JSON, and no other text."},
-    {"role": "user", "content": prompt}
-                ]),
-                capture_output=True,
-                text=True,
-                check=True,
-                env = env 
+    def _build_payload(self, input: str) -> Dict[str, Any]:
+        input_str = [
+            {"role": "system", "content": "You are a helpful assistant only capable of communicating with valid JSON, and no other text."},
+            {"role": "user", "content": f"{input}"},
+        ]
+
+        if self.model.startswith("gemini-pro"):
+            input_prompts = {
+                "role": "USER",
+                "parts": {"text": input_str[1]["content"]},
+            }
+            payload = {
+                "contents": input_prompts,
+                "generation_config": {
+                    "temperature": 0.2,
+                    "top_p": 0.1,
+                    "top_k": 16,
+                    "max_output_tokens": 2048,
+                    "candidate_count": 1,
+                    "stop_sequences": [],
+                },
+                "safety_settings": {
+                    "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+                    "threshold": "BLOCK_LOW_AND_ABOVE",
+                },
+            }
+
+        elif self.model.startswith("tgi"):
+            llama_input_str = build_llama2_prompt(input_str)
+            payload = {
+                "inputs": llama_input_str,
+                "parameters": {
+                    "do_sample": True,
+                    "top_p": 0.6,
+                    "temperature": 0.8,
+                    "top_k": 50,
+                    "max_new_tokens": 256,
+                    "repetition_penalty": 1.03,
+                    "stop": ["</s>"],
+                },
+            }
+
+        elif self.model.startswith("together"):
+            payload = self.together_chat.build_payload(
+                input_str, **self.other_parameters
             )
-            print("STDOUT:", result.stdout)
-            print("STDERR:", result.stderr)
-            print("Return code:", result.returncode)
-            return result.stdout.strip()
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"Error running Together subprocess: {e.stderr.strip()}")
-        
+
+        else:
+            payload = {
+                "model": self.model,
+                "messages": input_str,
+            }
+            payload.update(self.other_parameters)
+
+        return payload
+
+    def _handle_response(self, response: httpx.Response) -> str:
+        try:
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            if (response.status_code == 422) and ("must have less than" in response.text):
+                raise LongerThanContextError
+            else:
+                if (response.status_code == 401) and (self.token_provider is not None):
+                    # revoked or expired early, the next request fetches a new token
+                    self.token_provider.invalidate()
+                raise e
+
+        return self.parse_response(response)
+
+    def _cache_get(self, payload: Dict[str, Any]) -> Tuple[Union[str, None], Union[str, None]]:
+        if self.response_cache is None:
+            return None, None
+        key = self.response_cache.make_key(self.model, payload)
+        cached = self.response_cache.get(key)
+        if (cached is None) and self.response_cache.cache_only:
+            raise LLMCacheMissError(f"No cached {self.model} response for request {key}")
+        return cached, key
+
+    def _cache_put(self, key: Union[str, None], response: str) -> None:
+        if self.response_cache is not None:
+            self.response_cache.put(key, self.model, response)  # type: ignore
+
     def guardrail_endpoint(self) -> Callable:
         def end_point(input: str, **kwargs) -> str:
-            input_str = [
-                {"role": "system", "content": "You are a helpful assistant only capable of communicating with valid JSON, and no other text."},
-                {"role": "user", "content": f"{input}"},
-            ]
-
-            if self.model.startswith("gemini-pro"):
-                input_prompts = {
-                    "role": "USER",
-                    "parts": {"text": input_str[1]["content"]},
-                }
-                payload = {
-                    "contents": input_prompts,
-                    "generation_config": {
-                        "temperature": 0.2,
-                        "top_p": 0.1,
-                        "top_k": 16,
-                        "max_output_tokens": 2048,
-                        "candidate_count": 1,
-                        "stop_sequences": [],
-                    },
-                    "safety_settings": {
-                        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                        "threshold": "BLOCK_LOW_AND_ABOVE",
-                    },
-                }
-                response = httpx.post(self.end_point, headers=self.headers, json=payload, timeout=600.0)
-
-            elif self.model.startswith("tgi"):
-                llama_input_str = build_llama2_prompt(input_str)
-                payload = {
-                    "inputs": llama_input_str,
-                    "parameters": {
-                        "do_sample": True,
-                        "top_p": 0.6,
-                        "temperature": 0.8,
-                        "top_k": 50,
-                        "max_new_tokens": 256,
-                        "repetition_penalty": 1.03,
-                        "stop": ["</s>"],
-                    },
-                }
-                response = httpx.post(self.end_point, headers=self.headers, json=payload, timeout=600.0)
-
-            elif self.model.startswith("together"):
-                print("Running Together subprocess...")
-                return self.run_together_subprocess(input)
+            payload = self._build_payload(input)
+            cached, key = self._cache_get(payload)
+            if cached is not None:
+                return cached
+            response = self._handle_response(self._post(payload))
+            self._cache_put(key, response)
+            return response
 
-            else:
-                payload = {
-                    "model": self.model,
-                    "messages": input_str,
-                }
-                payload.update(self.other_parameters)
-                response = httpx.post(
-                    self.end_point, headers=self.headers, json=payload, timeout=600.0
-                )
+        return end_point
 
-            try:
-                response.raise_for_status()
-            except httpx.HTTPStatusError as e:
-                if (response.status_code == 422) and ("must have less than" in response.text):
-                    raise LongerThanContextError
-                else:
-                    raise e
+    def async_guardrail_endpoint(self) -> Callable[..., Awaitable[str]]:
+        """
+        Coroutine version of guardrail_endpoint on the AsyncClient, so one event loop
+        can keep many requests in flight.
+        """
 
-            return self.parse_response(response)
+        async def end_point(input: str, **kwargs) -> str:
+            payload = self._build_payload(input)
+            cached, key = self._cache_get(payload)
+            if cached is not None:
+                return cached
+            response = self._handle_response(await self._apost(payload))
+            self._cache_put(key, response)
+            return response
 
-        return end_point
\ No newline at end of file
+        return end_point
@@ -1,9 +1,17 @@
 # from langchain_community.embeddings import OpenAIEmbeddings
 import os
+import hashlib
+import threading
+import torch
 import numpy as np
-from typing import List, Union
+import multiprocessing
+from collections import OrderedDict
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Union, Dict, Any, Tuple
 from sentence_transformers import SentenceTransformer
 from transformers import AutoTokenizer
+from .embedding_cache import DiskEmbeddingCache
 
 
 class LocalLongTextEmbedder:
@@ -11,19 +19,120 @@ class LocalLongTextEmbedder:
     Embedding function using sentence-transformers/all-MiniLM-L6-v2 as embedding backend.
     If the input is larger than the context size (token limit), the input is split into chunks
     and embedded separately. The final embedding is the average of the embeddings of the chunks.
+    With a fast tokenizer the chunks are cut once as token ids and fed to the model directly,
+    and `chunk_size` is capped at the model's `max_seq_length`. Chunks of all documents in one call
+    are encoded together in batches of `batch_size`.
+    `backend="onnx"` runs the model through ONNX Runtime with `num_threads` intra-op threads,
+    `onnx_quantize` (e.g. "avx512_vnni", "avx2", "arm64") selects an int8 dynamically quantized
+    export that is built once under `onnx_dir`.
+    With `num_workers > 0`, calls with at least `pool_min_docs` uncached texts are split over a
+    pool of worker processes that each load the model once and write into shared memory.
+    Embeddings of the last `cache_size` distinct texts are kept in an LRU cache, so repeated
+    texts such as the persona query are only embedded once (`cache_size=0` disables it).
+    With `disk_cache_dir` set, embeddings are also kept on disk across runs (see DiskEmbeddingCache).
     """
 
     def __init__(
         self,
         embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2",
-        chunk_size: int = 512,  # effective input limit of MiniLM-L6-v2 is ~256 tokens
+        chunk_size: int = 512,  # capped at the model's max_seq_length (256 for MiniLM-L6-v2)
         verbose: bool = False,
+        cache_size: int = 1024,
+        batch_size: int = 32,
+        disk_cache_dir: Union[str, None] = None,
+        disk_cache_size: int = 200_000,
+        backend: str = "torch",
+        onnx_quantize: Union[str, None] = None,
+        onnx_dir: Union[str, None] = None,
+        num_threads: Union[int, None] = None,
+        num_workers: int = 0,
+        pool_min_docs: int = 64,
     ) -> None:
+        # workers build the same embedder, without caches or a pool of their own
+        self._worker_config = {
+            "embedding_model": embedding_model,
+            "chunk_size": chunk_size,
+            "cache_size": 0,
+            "batch_size": batch_size,
+            "backend": backend,
+            "onnx_quantize": onnx_quantize,
+            "onnx_dir": onnx_dir,
+            "num_threads": num_threads,
+        }
+        self.num_workers = num_workers
+        self.pool_min_docs = pool_min_docs
+        self._pool: Union[ProcessPoolExecutor, None] = None
         self.model_name = embedding_model
-        self.chunk_size = chunk_size
+        self.backend = backend
+        self.onnx_quantize = onnx_quantize
         self.verbose = verbose
-        self.model = SentenceTransformer(self.model_name)
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.model = self._load_model(onnx_dir, num_threads)
         self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        # longer inputs are silently truncated by the model
+        max_seq_length = self.model.max_seq_length
+        self.chunk_size = (
+            min(chunk_size, max_seq_length) if max_seq_length else chunk_size
+        )
+        self.disk_cache = (
+            DiskEmbeddingCache(
+                disk_cache_dir,
+                emb_dim=self.get_embedding_dimension(),
+                max_entries=disk_cache_size,
+            )
+            if disk_cache_dir
+            else None
+        )
+
+    def _load_model(
+        self, onnx_dir: Union[str, None], num_threads: Union[int, None]
+    ) -> SentenceTransformer:
+        if self.backend == "torch":
+            return SentenceTransformer(self.model_name)
+        if self.backend != "onnx":
+            raise ValueError("backend must be either [torch] or [onnx]")
+        import onnxruntime as ort
+
+        session_options = ort.SessionOptions()
+        if num_threads:
+            session_options.intra_op_num_threads = num_threads
+        model_kwargs = {
+            "provider": "CPUExecutionProvider",
+            "session_options": session_options,
+        }
+        if not self.onnx_quantize:
+            return SentenceTransformer(
+                self.model_name, backend="onnx", model_kwargs=model_kwargs
+            )
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        if onnx_dir is None:
+            onnx_dir = os.path.join(
+                os.path.expanduser("~"),
+                ".cache",
+                "puppy_onnx",
+                self.model_name.replace("/", "__"),
+            )
+        file_name = os.path.join("onnx", f"model_qint8_{self.onnx_quantize}.onnx")
+        if not os.path.exists(os.path.join(onnx_dir, file_name)):
+            # export and quantize once, later runs load the saved graph
+            fp32_model = SentenceTransformer(self.model_name, backend="onnx")
+            fp32_model.save(onnx_dir)
+            export_dynamic_quantized_onnx_model(
+                fp32_model,
+                quantization_config=self.onnx_quantize,
+                model_name_or_path=onnx_dir,
+            )
+        return SentenceTransformer(
+            onnx_dir,
+            backend="onnx",
+            model_kwargs={**model_kwargs, "file_name": file_name},
+        )
 
     def _tokenize_text(self, text: str) -> List[str]:
         """Splits long text into chunks based on token length."""
@@ -35,21 +144,186 @@ class LocalLongTextEmbedder:
             chunks.append(chunk_text)
         return chunks
 
-    def _embed(self, text: Union[str, List[str]]) -> List[List[float]]:
+    def _encode_text_chunks(self, docs: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Slow path for tokenizers without overflow support: chunks are re-tokenized by encode."""
+        chunks, chunk_counts = [], []
+        for doc in docs:
+            # an empty text still yields one (empty) chunk so every segment is non-empty
+            doc_chunks = self._tokenize_text(doc) or [doc]
+            chunks.extend(doc_chunks)
+            chunk_counts.append(len(doc_chunks))
+        # sentence-transformers sorts the chunks by length internally
+        chunk_embeddings = self.model.encode(chunks, batch_size=self.batch_size)
+        return np.asarray(chunk_embeddings), np.array(chunk_counts)
+
+    def _encode_token_chunks(self, docs: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Tokenizes all documents once, letting the fast tokenizer split them into
+        overflowing windows of at most chunk_size ids, and runs the model on the ids.
+        """
+        features = self.tokenizer(
+            docs,
+            max_length=self.chunk_size,
+            truncation=True,
+            return_overflowing_tokens=True,
+        )
+        chunk_counts = np.bincount(
+            features["overflow_to_sample_mapping"], minlength=len(docs)
+        )
+        input_ids = features["input_ids"]
+        # length-sorted batches keep padding small
+        order = np.argsort([len(ids) for ids in input_ids], kind="stable")
+        chunk_embeddings = np.empty(
+            (len(input_ids), self.get_embedding_dimension()), dtype=np.float32
+        )
+        self.model.eval()
+        with torch.no_grad():
+            for start in range(0, len(order), self.batch_size):
+                batch_rows = order[start : start + self.batch_size]
+                batch = self.tokenizer.pad(
+                    {
+                        name: [features[name][i] for i in batch_rows]
+                        for name in self.tokenizer.model_input_names
+                        if name in features
+                    },
+                    return_tensors="pt",
+                )
+                batch = {name: t.to(self.model.device) for name, t in batch.items()}
+                chunk_embeddings[batch_rows] = (
+                    self.model(batch)["sentence_embedding"].float().cpu().numpy()
+                )
+        return chunk_embeddings, chunk_counts
+
+    def _cache_key(self, text: str) -> str:
+        # the chunk size and backend change the embedding
+        key = f"{self.model_name}\0{self.chunk_size}\0{self.backend}\0{self.onnx_quantize}"
+        return hashlib.sha1(f"{key}\0{text}".encode("utf-8")).hexdigest()
+
+    def _cache_get(self, key: str) -> Union[np.ndarray, None]:
+        with self._cache_lock:
+            emb = self._cache.get(key)
+            if emb is None:
+                self.cache_misses += 1
+            else:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+            return emb
+
+    def _cache_put(self, key: str, emb: np.ndarray) -> None:
+        with self._cache_lock:
+            self._cache[key] = emb
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def cache_info(self) -> Dict[str, Any]:
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "size": len(self._cache),
+            "max_size": self.cache_size,
+            "disk": self.disk_cache.info() if self.disk_cache is not None else None,
+        }
+
+    def _embed(self, text: Union[str, List[str]]) -> List[np.ndarray]:
         if isinstance(text, str):
             text = [text]
 
-        embeddings = []
-        for doc in text:
-            chunks = self._tokenize_text(doc)
-            if self.verbose:
-                print(f"Embedding {len(chunks)} chunk(s) from input text.")
+        embeddings: List[Union[np.ndarray, None]] = [None] * len(text)
+        miss_pos, miss_keys, miss_docs = [], [], []
+        use_key = (self.cache_size > 0) or (self.disk_cache is not None)
+        for pos, doc in enumerate(text):
+            key = self._cache_key(doc) if use_key else None
+            if self.cache_size > 0:
+                cached = self._cache_get(key)
+                if cached is not None:
+                    embeddings[pos] = cached
+                    continue
+            miss_pos.append(pos)
+            miss_keys.append(key)
+            miss_docs.append(doc)
+        if miss_docs and (self.disk_cache is not None):
+            still_miss = []
+            for i, cached in enumerate(self.disk_cache.get_many(miss_keys)):
+                if cached is None:
+                    still_miss.append(i)
+                    continue
+                cached.setflags(write=False)
+                if self.cache_size > 0:
+                    self._cache_put(miss_keys[i], cached)
+                embeddings[miss_pos[i]] = cached
+            miss_pos = [miss_pos[i] for i in still_miss]
+            miss_keys = [miss_keys[i] for i in still_miss]
+            miss_docs = [miss_docs[i] for i in still_miss]
+        if not miss_docs:
+            return embeddings  # type: ignore
+
+        if (self.num_workers > 0) and (len(miss_docs) >= self.pool_min_docs):
+            avg_embeddings = self._compute_embeddings_pooled(miss_docs)
+        else:
+            avg_embeddings = self._compute_embeddings(miss_docs)
+        # cached arrays are shared, callers get copies from __call__
+        avg_embeddings.setflags(write=False)
+        if self.disk_cache is not None:
+            self.disk_cache.put_many(miss_keys, avg_embeddings)
+        for pos, key, avg_embedding in zip(miss_pos, miss_keys, avg_embeddings):
+            if self.cache_size > 0:
+                self._cache_put(key, avg_embedding)
+            embeddings[pos] = avg_embedding
 
-            chunk_embeddings = self.model.encode(chunks)
-            avg_embedding = np.mean(chunk_embeddings, axis=0)
-            embeddings.append(avg_embedding)
+        return embeddings  # type: ignore
 
-        return embeddings
+    def _compute_embeddings(self, docs: List[str]) -> np.ndarray:
+        # chunks of all documents are encoded together
+        if getattr(self.tokenizer, "is_fast", False):
+            chunk_embeddings, chunk_counts = self._encode_token_chunks(docs)
+        else:
+            chunk_embeddings, chunk_counts = self._encode_text_chunks(docs)
+        if self.verbose:
+            print(
+                f"Embedded {len(chunk_embeddings)} chunk(s) from {len(docs)} input text(s)."
+            )
+        starts = np.concatenate([[0], np.cumsum(chunk_counts)[:-1]])
+        return (
+            np.add.reduceat(np.asarray(chunk_embeddings, dtype=np.float64), starts, axis=0)
+            / chunk_counts[:, None]
+        ).astype("float32")
+
+    def _compute_embeddings_pooled(self, docs: List[str]) -> np.ndarray:
+        """Splits docs into contiguous shards, one per worker, so rows come back in input order."""
+        if self._pool is None:
+            # spawn, forking a process that already holds torch / ONNX Runtime threads is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_pool_worker,
+                initargs=(self._worker_config, self.num_workers),
+            )
+        shape = (len(docs), self.get_embedding_dimension())
+        shm = shared_memory.SharedMemory(
+            create=True, size=int(np.prod(shape)) * np.dtype(np.float32).itemsize
+        )
+        try:
+            bounds = np.linspace(0, len(docs), self.num_workers + 1).astype(int)
+            futures = [
+                self._pool.submit(
+                    _pool_worker_embed, shm.name, shape, start, docs[start:end]
+                )
+                for start, end in zip(bounds[:-1], bounds[1:])
+                if end > start
+            ]
+            for future in futures:
+                future.result()
+            return np.ndarray(shape, dtype=np.float32, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def close(self) -> None:
+        """Shuts the worker pool down, it is started again on the next pooled call."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
 
     def __call__(self, text: Union[str, List[str]]) -> np.ndarray:
         """
@@ -62,6 +336,78 @@ class LocalLongTextEmbedder:
         return self.model.get_sentence_embedding_dimension()
 
 
+# embedder of a pool worker process, loaded once by the pool initializer
+_pool_worker_embedder: Union[LocalLongTextEmbedder, None] = None
+
+
+def _init_pool_worker(worker_config: Dict[str, Any], num_workers: int) -> None:
+    global _pool_worker_embedder
+    # share the cores between workers instead of every worker using all of them
+    threads = max(1, (os.cpu_count() or 1) // num_workers)
+    torch.set_num_threads(threads)
+    if worker_config.get("num_threads") is None:
+        worker_config = {**worker_config, "num_threads": threads}
+    _pool_worker_embedder = LocalLongTextEmbedder(**worker_config)
+
+
+def _pool_worker_embed(
+    shm_name: str, shape: Tuple[int, int], start: int, docs: List[str]
+) -> int:
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        out = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        out[start : start + len(docs)] = _pool_worker_embedder._compute_embeddings(docs)  # type: ignore
+        del out  # the buffer must not be referenced when it is closed
+    finally:
+        shm.close()
+    return len(docs)
+
+
+def check_backend_parity(
+    emb_config: Dict[str, Any], texts: List[str], min_cosine: float = 0.99
+) -> float:
+    """
+    Embeds texts with the backend in emb_config and with the PyTorch backend and returns the
+    lowest cosine similarity between the two, raising if it is below min_cosine.
+    """
+    no_cache = {"cache_size": 0, "disk_cache_dir": None}
+    reference = LocalLongTextEmbedder(**{**emb_config, **no_cache, "backend": "torch"})
+    candidate = LocalLongTextEmbedder(**{**emb_config, **no_cache})
+    reference_emb = reference(texts)
+    candidate_emb = candidate(texts)
+    cosine = np.sum(reference_emb * candidate_emb, axis=1) / (
+        np.linalg.norm(reference_emb, axis=1) * np.linalg.norm(candidate_emb, axis=1)
+    )
+    worst = float(np.min(cosine))
+    if worst < min_cosine:
+        raise ValueError(
+            f"{emb_config.get('backend', 'torch')} backend drifts from torch: cosine {worst:.4f} < {min_cosine}"
+        )
+    return worst
+
+
+# process-wide embedders keyed by their config, shared by all memory layers and agents
+_embedder_registry: Dict[str, LocalLongTextEmbedder] = {}
+_embedder_registry_lock = threading.Lock()
+
+
+def get_embedder(emb_config: Dict[str, Any]) -> LocalLongTextEmbedder:
+    """
+    Returns the embedder for emb_config, loading the model on first use only.
+    With `server_url` set, returns a client of the embedding server at that url instead.
+    """
+    key = repr(sorted(emb_config.items()))
+    with _embedder_registry_lock:
+        if key not in _embedder_registry:
+            if emb_config.get("server_url"):
+                from .embedding_server import RemoteEmbedder
+
+                _embedder_registry[key] = RemoteEmbedder(**emb_config)  # type: ignore
+            else:
+                _embedder_registry[key] = LocalLongTextEmbedder(**emb_config)
+        return _embedder_registry[key]
+
+
 # embedder = LocalLongTextEmbedder(verbose = True)
 # text = "This is a long article or passage that you want to embed. " * 100  # simulate long input
 # embedding = embedder(text)
@@ -0,0 +1,165 @@
+import os
+import pickle
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import List, Tuple, Union, Dict
+
+
+class DiskEmbeddingCache:
+    """
+    Content-addressed embedding cache on disk, shared across runs.
+    Vectors live in a fixed-size memory-mapped float32 file (`vectors.f32`, one row per
+    slot). A pickled key index (`keys.pkl`) maps text keys to slots in LRU order, and
+    later changes, hits included, are appended to a journal (`keys.log`) that is folded
+    into the index every so often, so the LRU order carries over to the next run. When
+    all `max_entries` slots are taken the least recently used entries are evicted. A
+    cache directory is meant for one process at a time.
+    """
+
+    def __init__(self, path: str, emb_dim: int, max_entries: int = 200_000) -> None:
+        self.path = path
+        self.emb_dim = emb_dim
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        vectors_path = os.path.join(path, "vectors.f32")
+        self._keys_path = os.path.join(path, "keys.pkl")
+        self._log_path = os.path.join(path, "keys.log")
+        if os.path.exists(self._keys_path) and os.path.exists(vectors_path):
+            with open(self._keys_path, "rb") as f:
+                state = pickle.load(f)
+            if (state["emb_dim"] != emb_dim) or (state["max_entries"] != max_entries):
+                raise ValueError(
+                    f"Embedding cache {path} was created with emb_dim={state['emb_dim']}, "
+                    f"max_entries={state['max_entries']}"
+                )
+            # key -> slot, least recently used first
+            self._slots: "OrderedDict[str, int]" = state["slots"]
+            self._log_records = self._replay_log()
+            mode = "r+"
+        else:
+            self._slots = OrderedDict()
+            self._log_records = 0
+            mode = "w+"
+        self._vectors = np.memmap(
+            vectors_path, dtype=np.float32, mode=mode, shape=(max_entries, emb_dim)
+        )
+        if mode == "w+":
+            self._compact()
+        used = set(self._slots.values())
+        self._free = [i for i in range(max_entries - 1, -1, -1) if i not in used]
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _replay_log(self) -> int:
+        # replaying records the index already holds gives the same state, so a crash
+        # between writing the index and truncating the journal is harmless
+        n_records = 0
+        if not os.path.exists(self._log_path):
+            return n_records
+        with open(self._log_path, "rb") as f:
+            while True:
+                try:
+                    op, key, slot = pickle.load(f)
+                except (EOFError, pickle.UnpicklingError):
+                    # end of the journal or a record cut short by a crash
+                    break
+                if op == "put":
+                    self._slots[key] = slot
+                elif op == "use":
+                    if self._slots.get(key) == slot:
+                        self._slots.move_to_end(key)
+                else:
+                    self._slots.pop(key, None)
+                n_records += 1
+        return n_records
+
+    def _append_log(self, records: List[Tuple[str, str, int]], sync: bool = True) -> None:
+        with open(self._log_path, "ab") as f:
+            for record in records:
+                pickle.dump(record, f)
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+        self._log_records += len(records)
+        if self._log_records > max(1024, len(self._slots)):
+            self._compact()
+
+    def get_many(self, keys: List[str]) -> List[Union[np.ndarray, None]]:
+        ret = []
+        with self._lock:
+            used = []
+            for key in keys:
+                slot = self._slots.get(key)
+                if slot is None:
+                    self.misses += 1
+                    ret.append(None)
+                else:
+                    self._slots.move_to_end(key)
+                    used.append(("use", key, slot))
+                    self.hits += 1
+                    ret.append(np.array(self._vectors[slot]))
+            if used:
+                # losing a recency record only ages an entry, no fsync needed
+                self._append_log(used, sync=False)
+        return ret
+
+    def put_many(self, keys: List[str], embs: np.ndarray) -> None:
+        with self._lock:
+            new = {}
+            used = []
+            for key, emb in zip(keys, embs):
+                if key in self._slots:
+                    # the key is the content, the stored vector is already this one
+                    self._slots.move_to_end(key)
+                    used.append(("use", key, self._slots[key]))
+                else:
+                    new[key] = emb
+            if used:
+                self._append_log(used, sync=False)
+            new_items = list(new.items())[-self.max_entries :]
+            if not new_items:
+                return
+            # evicted slots are only reused once the journal says their keys are gone,
+            # so no key on disk ever points at another text's vector
+            n_evict = len(new_items) - len(self._free)
+            if n_evict > 0:
+                evicted = [self._slots.popitem(last=False) for _ in range(n_evict)]
+                self._append_log([("del", key, slot) for key, slot in evicted])
+                self._free.extend(slot for _, slot in evicted)
+            records = []
+            for key, emb in new_items:
+                slot = self._free.pop()
+                self._vectors[slot] = emb
+                self._slots[key] = slot
+                records.append(("put", key, slot))
+            self._vectors.flush()
+            self._append_log(records)
+
+    def _compact(self) -> None:
+        # write the index next to the old one first so a crash never leaves it half written
+        tmp_path = f"{self._keys_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(
+                {
+                    "emb_dim": self.emb_dim,
+                    "max_entries": self.max_entries,
+                    "slots": self._slots,
+                },
+                f,
+            )
+        os.replace(tmp_path, self._keys_path)
+        open(self._log_path, "wb").close()
+        self._log_records = 0
+
+    def info(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._slots),
+            "max_size": self.max_entries,
+        }
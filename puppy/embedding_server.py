@@ -0,0 +1,203 @@
+import json
+import time
+import queue
+import httpx
+import threading
+import numpy as np
+from typing import List, Union, Dict, Any, Tuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .embedding import LocalLongTextEmbedder
+
+
+class _PendingRequest:
+    def __init__(self, texts: List[str]) -> None:
+        self.texts = texts
+        self.result: Union[np.ndarray, None] = None
+        self.error: Union[Exception, None] = None
+        self.done = threading.Event()
+
+
+class EmbeddingServer:
+    """
+    Local HTTP embedding daemon holding one LocalLongTextEmbedder for several processes.
+    Concurrent requests are queued and coalesced into one embedder call of up to
+    `max_batch_docs` texts, waiting at most `max_wait_ms` for more requests to join.
+
+    POST /embed with {"texts": [...]} returns float32 bytes with an X-Shape header,
+    GET /info returns the model name, chunk size, backend and embedding dimension.
+    """
+
+    def __init__(
+        self,
+        emb_config: Dict[str, Any],
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        max_batch_docs: int = 64,
+        max_wait_ms: float = 5.0,
+    ) -> None:
+        self.embedder = LocalLongTextEmbedder(**emb_config)
+        self.max_batch_docs = max_batch_docs
+        self.max_wait = max_wait_ms / 1000
+        self.requests: "queue.Queue[_PendingRequest]" = queue.Queue()
+        self.batches = 0
+        self.batched_requests = 0
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._batcher = threading.Thread(target=self._batch_loop, daemon=True)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "embedding_model": self.embedder.model_name,
+            "chunk_size": self.embedder.chunk_size,
+            "backend": self.embedder.backend,
+            "onnx_quantize": self.embedder.onnx_quantize,
+            "dim": self.embedder.get_embedding_dimension(),
+            "batches": self.batches,
+            "requests": self.batched_requests,
+        }
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Queues texts for the next batch and waits for their embeddings."""
+        if not texts:
+            return np.empty(
+                (0, self.embedder.get_embedding_dimension()), dtype=np.float32
+            )
+        pending = _PendingRequest(texts)
+        self.requests.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result  # type: ignore
+
+    def _batch_loop(self) -> None:
+        while True:
+            batch = [self.requests.get()]
+            n_docs = len(batch[0].texts)
+            # wait for more requests to join until the window closes or the batch is full
+            window_end = time.monotonic() + self.max_wait
+            while n_docs < self.max_batch_docs:
+                timeout = window_end - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    pending = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(pending)
+                n_docs += len(pending.texts)
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: List[_PendingRequest]) -> None:
+        try:
+            embs = self.embedder([t for pending in batch for t in pending.texts])
+        except Exception as e:
+            for pending in batch:
+                pending.error = e
+                pending.done.set()
+            return
+        self.batches += 1
+        self.batched_requests += len(batch)
+        start = 0
+        for pending in batch:
+            pending.result = embs[start : start + len(pending.texts)]
+            start += len(pending.texts)
+            pending.done.set()
+
+    def _handler_class(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, status: int, body: bytes, headers: Dict[str, str]) -> None:
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self) -> None:
+                if self.path != "/info":
+                    self._send(404, b"", {})
+                    return
+                body = json.dumps(server.info()).encode("utf-8")
+                self._send(200, body, {"Content-Type": "application/json"})
+
+            def do_POST(self) -> None:
+                if self.path != "/embed":
+                    self._send(404, b"", {})
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    texts = json.loads(self.rfile.read(length))["texts"]
+                except Exception as e:
+                    self._send(
+                        400, str(e).encode("utf-8"), {"Content-Type": "text/plain"}
+                    )
+                    return
+                try:
+                    embs = np.ascontiguousarray(server.embed(texts), dtype=np.float32)
+                    if embs.ndim != 2:
+                        raise ValueError(f"Embedder returned shape {embs.shape}")
+                except Exception as e:
+                    self._send(
+                        500, str(e).encode("utf-8"), {"Content-Type": "text/plain"}
+                    )
+                    return
+                self._send(
+                    200,
+                    embs.tobytes(),
+                    {
+                        "Content-Type": "application/octet-stream",
+                        "X-Shape": f"{embs.shape[0]},{embs.shape[1]}",
+                    },
+                )
+
+            def log_message(self, format: str, *args: Any) -> None:
+                # one line per request would flood the console
+                pass
+
+        return Handler
+
+    def serve_forever(self) -> None:
+        self._batcher.start()
+        self.httpd.serve_forever()
+
+    def shutdown(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class RemoteEmbedder:
+    """
+    Client of EmbeddingServer with the LocalLongTextEmbedder call interface, selected by
+    setting `server_url` in the embedding config.
+    """
+
+    def __init__(self, server_url: str, timeout: float = 600.0, **kwargs: Any) -> None:
+        # other keys of the embedding config describe the server's model, the server owns them
+        self.server_url = server_url.rstrip("/")
+        self.client = httpx.Client(base_url=self.server_url, timeout=timeout)
+        response = self.client.get("/info")
+        response.raise_for_status()
+        info = response.json()
+        self.model_name = info["embedding_model"]
+        self.chunk_size = info["chunk_size"]
+        self.backend = info.get("backend", "torch")
+        self.onnx_quantize = info.get("onnx_quantize")
+        self.emb_dim = info["dim"]
+
+    def __call__(self, text: Union[str, List[str]]) -> np.ndarray:
+        if isinstance(text, str):
+            text = [text]
+        response = self.client.post("/embed", json={"texts": list(text)})
+        response.raise_for_status()
+        shape: Tuple[int, ...] = tuple(
+            int(i) for i in response.headers["X-Shape"].split(",")
+        )
+        return np.frombuffer(response.content, dtype=np.float32).reshape(shape).copy()
+
+    def get_embedding_dimension(self) -> int:
+        return self.emb_dim
+
+    def close(self) -> None:
+        self.client.close()
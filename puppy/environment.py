@@ -13,9 +13,10 @@ market_info_type = Tuple[
     Union[str, None],  # cur filing_q
     List[str],  # cur news
     float,  # cur record
+    Union[Dict[str, Any], None],  # cur precomputed embeddings
     bool,  # termination flag
 ]
-terminated_market_info_type = Tuple[None, None, None, None, None, None, bool]
+terminated_market_info_type = Tuple[None, None, None, None, None, None, None, bool]
 
 
 # env data structure validation
@@ -33,6 +34,8 @@ class MarketEnvironment:
         start_date: date,
         end_date: date,
         symbol: str,
+        env_emb_pkl: Union[Dict[str, Any], None] = None,  # from precompute_embeddings
+        env_emb_path: Union[str, None] = None,  # file of env_emb_pkl, loaded if it is not given
     ) -> None:
         # validate structure
         first_date = list(env_data_pkl.keys())[0]
@@ -56,8 +59,33 @@ class MarketEnvironment:
         self.end_date = end_date
         self.cur_date = None
         self.env_data = env_data_pkl
+        # checkpoints keep only the path of the precomputed embeddings, see __getstate__
+        self.env_emb_path = env_emb_path
+        if (env_emb_pkl is None) and (env_emb_path is not None):
+            env_emb_pkl = self._load_env_emb(env_emb_path)
+        self.env_emb = None if env_emb_pkl is None else env_emb_pkl["data"]
         self.symbol = symbol
 
+    @staticmethod
+    def _load_env_emb(path: str) -> Dict[str, Any]:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        # reloaded from the file, a vector dict given without a path has to be kept
+        if state.get("env_emb_path") is not None:
+            state["env_emb"] = None
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        # checkpoints from before precomputed embeddings have neither attribute
+        state.setdefault("env_emb", None)
+        state.setdefault("env_emb_path", None)
+        self.__dict__.update(state)
+        if self.env_emb_path is not None:
+            self.env_emb = self._load_env_emb(self.env_emb_path)["data"]
+
     def reset(self) -> None:
         self.date_series = [
             i
@@ -72,7 +100,7 @@ class MarketEnvironment:
             self.cur_date = self.date_series.pop(0)  # type: ignore
             future_date = self.date_series[0]  # type: ignore
         except IndexError:
-            return None, None, None, None, None, None, True
+            return None, None, None, None, None, None, None, True
 
         cur_date = self.cur_date
         cur_price = self.env_data[self.cur_date]["price"]
@@ -99,6 +127,15 @@ class MarketEnvironment:
         else:
             cur_filing_q = cur_filing_q[self.symbol]
 
+        # vectors for the filings and news above, None where they are not precomputed
+        cur_emb = None
+        if self.env_emb is not None:
+            cur_date_emb = self.env_emb.get(self.cur_date, {})
+            cur_emb = {
+                kind: cur_date_emb.get(kind, {}).get(self.symbol)
+                for kind in ["filing_k", "filing_q", "news"]
+            }
+
         return (
             cur_date,
             cur_price[self.symbol],
@@ -106,6 +143,7 @@ class MarketEnvironment:
             cur_filing_q,
             cur_news[self.symbol],
             cur_record[self.symbol],
+            cur_emb,
             False,
         )
 
@@ -0,0 +1,201 @@
+import re
+import json
+import time
+import random
+import threading
+import numpy as np
+from typing import List, Dict, Any, Union
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# memory sections of the reflection prompt and the json fields their ids go to
+_memory_sections = {
+    "short_memory_index": "The short-term information:",
+    "middle_memory_index": "The mid-term information:",
+    "long_memory_index": "The long-term information:",
+    "reflection_memory_index": "The reflection-term information:",
+}
+# id prefix of a memory entry, "<id>. <text>"
+_memory_id_pattern = re.compile(r"(-?\d+)\. ")
+
+
+class StubLLMServer:
+    """
+    Local stand-in for the LLM endpoint, for offline load tests of the agent loop.
+    It answers the OpenAI/Together chat-completions (`messages`), TGI (`inputs`) and
+    Gemini (`contents`) request formats that ChatOpenAICompatible sends, on any path,
+    with reflection JSON that passes the guardrails schema: it cites the first memory
+    listed in each section of the prompt, and test-mode prompts also get a decision.
+
+    Each response waits `latency_ms` ("constant"), or a draw with that mean
+    ("exponential") or median ("lognormal", spread `latency_sigma`). A share
+    `error_rate` of requests fails with 500 and `context_error_rate` with the 422
+    context-length error, which is also returned for prompts over `max_prompt_chars`.
+    GET /stats returns request counts and latency percentiles.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8766,
+        latency_ms: float = 0.0,
+        latency_dist: str = "constant",
+        latency_sigma: float = 0.5,
+        error_rate: float = 0.0,
+        context_error_rate: float = 0.0,
+        max_prompt_chars: Union[int, None] = None,
+        seed: int = 0,
+    ) -> None:
+        if latency_dist not in ["constant", "exponential", "lognormal"]:
+            raise ValueError(f"Unknown latency distribution {latency_dist}")
+        self.latency_ms = latency_ms
+        self.latency_dist = latency_dist
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.context_error_rate = context_error_rate
+        self.max_prompt_chars = max_prompt_chars
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.status_counts: Dict[int, int] = {}
+        self.latencies: List[float] = []
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    def _draw(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def _latency(self) -> float:
+        if self.latency_ms <= 0:
+            return 0.0
+        with self._lock:
+            if self.latency_dist == "exponential":
+                latency_ms = self._rng.expovariate(1 / self.latency_ms)
+            elif self.latency_dist == "lognormal":
+                latency_ms = self._rng.lognormvariate(
+                    np.log(self.latency_ms), self.latency_sigma
+                )
+            else:
+                latency_ms = self.latency_ms
+        return latency_ms / 1000
+
+    def reflection(self, prompt: str) -> str:
+        """Schema-valid reflection JSON citing the first memory of each prompt section."""
+        ret: Dict[str, Any] = {}
+        # only the test prompt asks for a decision
+        if ("investment decision" in prompt) or ("investment_decision" in prompt):
+            ret["investment_decision"] = ["buy", "sell", "hold"][int(self._draw() * 3)]
+        ret["summary_reason"] = "Stub reflection for load testing."
+        # memory texts may hold numbered lists of their own, so only the line right
+        # after a section header is known to start an entry and carry an allowed id
+        pos = 0
+        for field, header in _memory_sections.items():
+            start = prompt.find(f"{header}\n", pos)
+            if start < 0:
+                continue
+            pos = start + len(header) + 1
+            match = _memory_id_pattern.match(prompt, pos)
+            if match:
+                ret[field] = [{"memory_index": int(match.group(1))}]
+        return json.dumps(ret)
+
+    def respond(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        if "messages" in request:
+            prompt = request["messages"][-1]["content"]
+            text = self.reflection(prompt)
+            return {
+                "object": "chat.completion",
+                "model": request.get("model", "stub"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": text},
+                        "finish_reason": "stop",
+                    }
+                ],
+            }
+        elif "inputs" in request:
+            return {"generated_text": self.reflection(request["inputs"])}
+        elif "contents" in request:
+            text = self.reflection(request["contents"]["parts"]["text"])
+            return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+        raise ValueError("Unknown request format")
+
+    @staticmethod
+    def prompt_length(request: Dict[str, Any]) -> int:
+        if "messages" in request:
+            return sum(len(m["content"]) for m in request["messages"])
+        return len(json.dumps(request))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = np.array(self.latencies) * 1000
+            stats: Dict[str, Any] = {
+                "requests": len(self.latencies),
+                "status": {str(k): v for k, v in self.status_counts.items()},
+            }
+        if len(latencies):
+            for q in [50, 90, 99]:
+                stats[f"p{q}_ms"] = float(np.percentile(latencies, q))
+            stats["max_ms"] = float(latencies.max())
+        return stats
+
+    def _record(self, status: int, latency: float) -> None:
+        with self._lock:
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+            self.latencies.append(latency)
+
+    def _handler_class(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send(self, status: int, body: Dict[str, Any]) -> None:
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self) -> None:
+                if self.path != "/stats":
+                    self._send(404, {"error": "not found"})
+                    return
+                self._send(200, server.stats())
+
+            def do_POST(self) -> None:
+                start = time.monotonic()
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    request = json.loads(self.rfile.read(length))
+                    time.sleep(server._latency())
+                    draw = server._draw()
+                    if (draw < server.context_error_rate) or (
+                        (server.max_prompt_chars is not None)
+                        and (server.prompt_length(request) > server.max_prompt_chars)
+                    ):
+                        # the wording ChatOpenAICompatible maps to LongerThanContextError
+                        status, body = 422, {
+                            "error": "Input validation error: `inputs` tokens + `max_new_tokens` must have less than 4096 tokens"
+                        }
+                    elif draw < server.context_error_rate + server.error_rate:
+                        status, body = 500, {"error": "Stub server error"}
+                    else:
+                        status, body = 200, server.respond(request)
+                except Exception as e:
+                    status, body = 400, {"error": str(e)}
+                self._send(status, body)
+                server._record(status, time.monotonic() - start)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return Handler
+
+    def serve_forever(self) -> None:
+        self.httpd.serve_forever()
+
+    def shutdown(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -1,4 +1,13 @@
+import numpy as np
+
+
 class LinearImportanceScoreChange:
+    def change_array(
+        self, access_counter: np.ndarray, importance_score: np.ndarray
+    ) -> np.ndarray:
+        return importance_score + access_counter * 5
+
     def __call__(self, access_counter: int, importance_score: float) -> float:
-        importance_score += access_counter * 5
-        return importance_score
+        return self.change_array(
+            np.asarray(access_counter), np.asarray(importance_score)
+        )[()]
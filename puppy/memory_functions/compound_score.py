@@ -1,11 +1,28 @@
+import numpy as np
+
+
 class LinearCompoundScore:
+    def recency_and_importance_score_array(
+        self, recency_score: np.ndarray, importance_score: np.ndarray
+    ) -> np.ndarray:
+        importance_score = np.minimum(importance_score, 100)
+        return recency_score + importance_score / 100
+
+    def merge_score_array(
+        self, similarity_score: np.ndarray, recency_and_importance: np.ndarray
+    ) -> np.ndarray:
+        return similarity_score + recency_and_importance
+
     def recency_and_importance_score(
         self, recency_score: float, importance_score: float
     ) -> float:
-        importance_score = min(importance_score, 100)
-        return recency_score + importance_score / 100
+        return self.recency_and_importance_score_array(
+            np.asarray(recency_score), np.asarray(importance_score)
+        )[()]
 
     def merge_score(
         self, similarity_score: float, recency_and_importance: float
     ) -> float:
-        return similarity_score + recency_and_importance
+        return self.merge_score_array(
+            np.asarray(similarity_score), np.asarray(recency_and_importance)
+        )[()]
@@ -11,11 +11,78 @@ class ExponentialDecay:
         self.recency_factor = recency_factor
         self.importance_factor = importance_factor
 
+    def decay_array(
+        self, important_score: np.ndarray, delta: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return self.decay_steps_array(important_score, delta, 1)
+
+    def decay_steps_array(
+        self,
+        important_score: np.ndarray,
+        delta: np.ndarray,
+        steps: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Closed form of applying the one-step decay `steps` times."""
+        delta = delta + steps
+        new_recency_score = np.exp(-(delta / self.recency_factor))
+        new_important_score = important_score * self.importance_factor**steps
+
+        return new_recency_score, new_important_score, delta
+
     def __call__(
         self, important_score: float, delta: float
     ) -> Tuple[float, float, float]:
-        delta += 1
-        new_recency_score = np.exp(-(delta / self.recency_factor))
-        new_important_score = important_score * self.importance_factor
+        new_recency_score, new_important_score, delta = self.decay_array(
+            np.asarray(important_score), np.asarray(delta)
+        )
+        return new_recency_score[()], new_important_score[()], delta[()]
 
-        return new_recency_score, new_important_score, delta
+    def steps_until_recency_below(
+        self, recency_score: np.ndarray, delta: np.ndarray, threshold: float
+    ) -> np.ndarray:
+        """Decay steps until recency drops below threshold, 0 if already, inf if never."""
+        if threshold > 0:
+            # recency after k >= 1 steps is exp(-(delta + k) / recency_factor)
+            steps = np.floor(-self.recency_factor * np.log(threshold) - delta) + 1
+            steps = np.maximum(steps, 1)
+        else:
+            steps = np.full(len(delta), np.inf)
+        return np.where(recency_score < threshold, 0, steps)
+
+    def steps_until_importance_below(
+        self, important_score: np.ndarray, threshold: float
+    ) -> np.ndarray:
+        """Decay steps until importance drops below threshold, 0 if already, inf if never."""
+        already = important_score < threshold
+        if self.importance_factor <= 0:
+            steps = np.ones(len(important_score))
+        elif (0 < self.importance_factor < 1) and (threshold > 0):
+            with np.errstate(divide="ignore", invalid="ignore"):
+                steps = (
+                    np.floor(
+                        np.log(threshold / important_score)
+                        / np.log(self.importance_factor)
+                    )
+                    + 1
+                )
+        else:
+            steps = np.full(len(important_score), np.inf)
+        return np.where(already, 0, steps)
+
+    def steps_until_importance_at_least(
+        self, important_score: np.ndarray, threshold: float
+    ) -> np.ndarray:
+        """Decay steps until importance reaches threshold, 0 if already, inf if never."""
+        already = important_score >= threshold
+        if self.importance_factor <= 0:
+            steps = np.ones(len(important_score))
+        elif (self.importance_factor > 1) and (threshold > 0):
+            with np.errstate(divide="ignore", invalid="ignore"):
+                steps = np.ceil(
+                    np.log(threshold / important_score)
+                    / np.log(self.importance_factor)
+                )
+            steps = np.where(important_score > 0, np.maximum(steps, 1), np.inf)
+        else:
+            steps = np.full(len(important_score), np.inf)
+        return np.where(already, 0, steps)
@@ -7,6 +7,10 @@ class ImportanceScoreInitialization(ABC):
     def __call__(self) -> float:
         pass
 
+    def sample_array(self, n: int) -> np.ndarray:
+        # subclasses override this with one vectorized draw
+        return np.array([self() for _ in range(n)], dtype=float)
+
 
 def get_importance_score_initialization_func(
     type: str, memory_layer: str
@@ -30,20 +34,29 @@ def get_importance_score_initialization_func(
 
 class I_SampleInitialization_Short(ImportanceScoreInitialization):
     def __call__(self) -> float:
+        return self.sample_array(1)[0]
+
+    def sample_array(self, n: int) -> np.ndarray:
         probabilities = [0.5, 0.45, 0.05]
         scores = [50.0, 70.0, 90.0]
-        return np.random.choice(scores, p=probabilities)
+        return np.random.choice(scores, size=n, p=probabilities)
 
 
 class I_SampleInitialization_Mid(ImportanceScoreInitialization):
     def __call__(self) -> float:
+        return self.sample_array(1)[0]
+
+    def sample_array(self, n: int) -> np.ndarray:
         probabilities = [0.05, 0.8, 0.15]
         scores = [40.0, 60.0, 80.0]
-        return np.random.choice(scores, p=probabilities)
+        return np.random.choice(scores, size=n, p=probabilities)
 
 
 class I_SampleInitialization_Long(ImportanceScoreInitialization):
     def __call__(self) -> float:
+        return self.sample_array(1)[0]
+
+    def sample_array(self, n: int) -> np.ndarray:
         probabilities = [0.05, 0.15, 0.8]
         scores = [40.0, 60.0, 80.0]
-        return np.random.choice(scores, p=probabilities)
+        return np.random.choice(scores, size=n, p=probabilities)
@@ -1,3 +1,9 @@
+import numpy as np
+
+
 class R_ConstantInitialization:
+    def sample_array(self, n: int) -> np.ndarray:
+        return np.ones(n)
+
     def __call__(self) -> float:
         return 1.0
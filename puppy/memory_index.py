@@ -0,0 +1,215 @@
+import faiss
+import numpy as np
+from typing import Set, Tuple, Union, List, Dict, Any
+
+
+class MemoryIndex:
+    """
+    Vector index of one symbol in a MemoryDB layer, built from a faiss factory string.
+    "Flat" keeps the exact IndexFlatIP + IndexIDMap2 behaviour. Other factories (e.g.
+    "HNSW32", "IVF256,Flat") stay on an exact flat index until `train_threshold`
+    vectors exist, then are trained and rebuilt from the stored embeddings. Removals
+    on approximate indexes are tombstoned and the index is rebuilt once tombstones
+    exceed `rebuild_threshold` of its size. Re-adding a tombstoned id drops its old
+    vector first, or flags the index for a rebuild when the index cannot remove (HNSW).
+    `storage` sets the exact index's encoding: "float32", "float16" or "sq8" (8-bit scalar
+    quantization over [-1, 1], no training data needed for unit-norm vectors). Approximate
+    indexes take theirs from the factory string, e.g. "HNSW32,SQ8" or "IVF256,SQfp16".
+    """
+
+    def __init__(
+        self,
+        emb_dim: int,
+        factory: str = "Flat",
+        train_threshold: int = 0,
+        rebuild_threshold: float = 0.25,
+        search_params: Union[str, None] = None,
+        storage: str = "float32",
+    ) -> None:
+        self.d = emb_dim
+        self.storage = storage
+        self.factory = factory
+        self.train_threshold = train_threshold
+        self.rebuild_threshold = rebuild_threshold
+        self.search_params = search_params
+        self.deleted: Set[int] = set()
+        # an approximate index still holds old vectors of re-added ids
+        self.stale = False
+        self.index = self._flat_index()
+        self.is_ann = False
+
+    @property
+    def exact(self) -> bool:
+        return self.factory == "Flat"
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal - len(self.deleted)
+
+    def _flat_index(self) -> faiss.Index:
+        # normalized inner product is cosine similarity
+        if self.storage == "float32":
+            return faiss.IndexIDMap2(faiss.IndexFlatIP(self.d))
+        if self.storage == "float16":
+            index = faiss.IndexScalarQuantizer(
+                self.d, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT
+            )
+        elif self.storage == "sq8":
+            index = faiss.IndexScalarQuantizer(
+                self.d, faiss.ScalarQuantizer.QT_8bit_uniform, faiss.METRIC_INNER_PRODUCT
+            )
+            # components of unit vectors lie in [-1, 1]
+            index.train(np.array([[-1.0] * self.d, [1.0] * self.d], dtype=np.float32))
+        else:
+            raise ValueError(
+                f"storage must be one of ['float32', 'float16', 'sq8'], got {self.storage}"
+            )
+        return faiss.IndexIDMap2(index)
+
+    def _ann_index(self) -> faiss.Index:
+        index = faiss.index_factory(self.d, self.factory, faiss.METRIC_INNER_PRODUCT)
+        if self.search_params:
+            faiss.ParameterSpace().set_index_parameters(index, self.search_params)
+        return faiss.IndexIDMap2(index)
+
+    def add_with_ids(self, emb: np.ndarray, ids: np.ndarray) -> None:
+        reused = self.deleted.intersection(ids.tolist())
+        if reused:
+            try:
+                self.index.remove_ids(np.array(sorted(reused), dtype=np.int64))
+            except RuntimeError:
+                # e.g. HNSW, the old vectors stay until the next rebuild
+                self.stale = True
+            self.deleted.difference_update(reused)
+        self.index.add_with_ids(emb, ids)
+
+    def remove_ids(self, ids: np.ndarray) -> None:
+        if not self.is_ann:
+            self.index.remove_ids(ids)
+        else:
+            self.deleted.update(ids.tolist())
+
+    def search(self, emb: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if not self.deleted:
+            return self.index.search(emb, k)
+        # over-fetch so that tombstoned hits can be dropped
+        fetch_k = min(k + len(self.deleted), self.index.ntotal)
+        dists, ids = self.index.search(emb, fetch_k)
+        ret_dists = np.full((len(emb), k), -np.inf, dtype=np.float32)
+        ret_ids = np.full((len(emb), k), -1, dtype=np.int64)
+        for i in range(len(emb)):
+            keep = [
+                j for j, cur_id in enumerate(ids[i]) if cur_id not in self.deleted
+            ][:k]
+            ret_dists[i, : len(keep)] = dists[i, keep]
+            ret_ids[i, : len(keep)] = ids[i, keep]
+        return ret_dists, ret_ids
+
+    def needs_rebuild(self) -> bool:
+        if self.exact:
+            return False
+        if not self.is_ann:
+            return self.ntotal >= max(self.train_threshold, 1)
+        if self.stale:
+            return True
+        return len(self.deleted) > self.rebuild_threshold * max(self.index.ntotal, 1)
+
+    def rebuild(self, emb: np.ndarray, ids: np.ndarray) -> None:
+        """Rebuilds from the live vectors, training the approximate index when needed."""
+        self.deleted = set()
+        self.stale = False
+        if self.exact or (len(ids) < max(self.train_threshold, 1)):
+            self.index = self._flat_index()
+            self.is_ann = False
+        else:
+            self.index = self._ann_index()
+            if not self.index.is_trained:
+                self.index.train(emb)
+            self.is_ann = True
+        if len(ids) > 0:
+            self.index.add_with_ids(emb, ids)
+
+    def save(self, path: str) -> None:
+        # tombstones are not saved, callers rebuild before saving
+        faiss.write_index(self.index, path)
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        factory: str = "Flat",
+        train_threshold: int = 0,
+        rebuild_threshold: float = 0.25,
+        search_params: Union[str, None] = None,
+        storage: str = "float32",
+    ) -> "MemoryIndex":
+        index = faiss.read_index(path)
+        obj = cls(
+            emb_dim=index.d,
+            factory=factory,
+            train_threshold=train_threshold,
+            rebuild_threshold=rebuild_threshold,
+            search_params=search_params,
+            storage=storage,
+        )
+        obj.index = index
+        # a saved flat index of a non-flat layer is still waiting for training
+        obj.is_ann = not isinstance(
+            faiss.downcast_index(index.index),
+            (faiss.IndexFlatIP, faiss.IndexScalarQuantizer),
+        )
+        return obj
+
+
+def vector_storage_report(
+    emb: np.ndarray,
+    queries: Union[np.ndarray, None] = None,
+    top_k: int = 5,
+    settings: Union[List[Tuple[str, Union[int, None]]], None] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Measures recall@top_k against exact float32 search at full dimension, and the bytes
+    one vector takes (index plus score store), for (storage, dim) settings of a layer.
+    emb holds unit-norm vectors, queries defaults to the first 200 of them.
+    """
+    emb = np.ascontiguousarray(emb, dtype=np.float32)
+    if queries is None:
+        queries = emb[:200]
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    full_dim = emb.shape[1]
+    if settings is None:
+        settings = [
+            (storage, dim)
+            for storage in ["float32", "float16", "sq8"]
+            for dim in [None, full_dim // 2, full_dim // 4]
+        ]
+    top_k = min(top_k, len(emb))
+    truth = np.argsort(-(queries @ emb.T), axis=1, kind="stable")[:, :top_k]
+    ids = np.arange(len(emb))
+    report = []
+    for storage, dim in settings:
+        dim = dim or full_dim
+        cur_emb = np.ascontiguousarray(emb[:, :dim])
+        faiss.normalize_L2(cur_emb)
+        cur_queries = np.ascontiguousarray(queries[:, :dim])
+        cur_index = MemoryIndex(emb_dim=dim, storage=storage)
+        cur_index.add_with_ids(cur_emb, ids)
+        _, found = cur_index.search(cur_queries, top_k)
+        recall = np.mean(
+            [
+                len(set(t) & set(f)) / top_k
+                for t, f in zip(truth.tolist(), found.tolist())
+            ]
+        )
+        # same encoding in the score store as in the flat index
+        bytes_per_vector = 2 * faiss.downcast_index(cur_index.index.index).code_size
+        report.append(
+            {
+                "storage": storage,
+                "dim": dim,
+                f"recall@{top_k}": float(recall),
+                "bytes_per_vector": int(bytes_per_vector),
+                "total_mb": bytes_per_vector * len(emb) / 2**20,
+            }
+        )
+    return report
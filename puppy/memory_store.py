@@ -0,0 +1,294 @@
+import numpy as np
+from datetime import date
+from typing import List, Dict, Any, Iterator, Iterable, Union
+
+
+class ScoreMemory:
+    """
+    Structure-of-arrays store for the scored records of one symbol in a MemoryDB layer.
+    Every score lives in its own NumPy column, the normalized embeddings in one
+    contiguous matrix, texts are kept in a separate list and rows stay in insertion order. Ordering by compound score is computed on demand
+    instead of being maintained on every insert.
+
+    Scores are stored as of the step in the `step` column; the owning MemoryDB brings
+    them up to its current step lazily. Removed rows are only marked dead and the
+    buffers are compacted once dead rows outnumber live ones.
+
+    Embeddings are kept as float32, float16 or "sq8" (int8 codes of the unit-norm
+    components scaled by 127); `emb_rows` always returns float32.
+    """
+
+    NEVER = np.iinfo(np.int64).max
+    _storage_dtypes = {"float32": np.float32, "float16": np.float16, "sq8": np.int8}
+    SQ8_SCALE = 127.0
+
+    _columns = {
+        "id": np.int64,
+        "important_score": np.float64,
+        "recency_score": np.float64,
+        "delta": np.int64,
+        "important_score_recency_compound_score": np.float64,
+        "access_counter": np.int64,
+        "date": "datetime64[D]",
+        "step": np.int64,
+        # scheduled steps for the next clean-up / jump check, NEVER if none
+        "clean_up_step": np.int64,
+        "jump_step": np.int64,
+        "alive": bool,
+    }
+
+    def __init__(
+        self, emb_dim: int, capacity: int = 16, storage: str = "float32"
+    ) -> None:
+        if storage not in self._storage_dtypes:
+            raise ValueError(
+                f"storage must be one of {list(self._storage_dtypes)}, got {storage}"
+            )
+        self.storage = storage
+        self._size = 0
+        self._live = 0
+        self._data = {
+            name: np.empty(capacity, dtype=dtype)
+            for name, dtype in self._columns.items()
+        }
+        self._emb = np.empty((capacity, emb_dim), dtype=self._storage_dtypes[storage])
+        self.text: List[str] = []
+        self.id_to_row: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return self._live
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Yields records as dicts in ascending compound score order."""
+        return iter(self.records(self.sorted_rows()))
+
+    def __contains__(self, cur_id: int) -> bool:
+        return cur_id in self.id_to_row
+
+    # columns are exposed as views over the filled part of the buffers, dead rows included
+    @property
+    def id(self) -> np.ndarray:
+        return self._data["id"][: self._size]
+
+    @property
+    def important_score(self) -> np.ndarray:
+        return self._data["important_score"][: self._size]
+
+    @property
+    def recency_score(self) -> np.ndarray:
+        return self._data["recency_score"][: self._size]
+
+    @property
+    def delta(self) -> np.ndarray:
+        return self._data["delta"][: self._size]
+
+    @property
+    def compound_score(self) -> np.ndarray:
+        return self._data["important_score_recency_compound_score"][: self._size]
+
+    @property
+    def access_counter(self) -> np.ndarray:
+        return self._data["access_counter"][: self._size]
+
+    @property
+    def date(self) -> np.ndarray:
+        return self._data["date"][: self._size]
+
+    @property
+    def step(self) -> np.ndarray:
+        return self._data["step"][: self._size]
+
+    @property
+    def clean_up_step(self) -> np.ndarray:
+        return self._data["clean_up_step"][: self._size]
+
+    @property
+    def jump_step(self) -> np.ndarray:
+        return self._data["jump_step"][: self._size]
+
+    @property
+    def alive(self) -> np.ndarray:
+        return self._data["alive"][: self._size]
+
+    @property
+    def emb(self) -> np.ndarray:
+        """Stored embedding codes, see emb_rows for float32 vectors."""
+        return self._emb[: self._size]
+
+    @property
+    def emb_nbytes(self) -> int:
+        return self._emb[: self._live].nbytes
+
+    def _encode_emb(self, emb: np.ndarray) -> np.ndarray:
+        if self.storage == "sq8":
+            return np.clip(
+                np.rint(emb * self.SQ8_SCALE), -self.SQ8_SCALE, self.SQ8_SCALE
+            ).astype(np.int8)
+        return emb
+
+    def emb_rows(self, rows: np.ndarray) -> np.ndarray:
+        emb = self._emb[rows]
+        if self.storage == "sq8":
+            return emb.astype(np.float32) / np.float32(self.SQ8_SCALE)
+        return emb.astype(np.float32, copy=False)
+
+    def _reserve(self, extra: int) -> None:
+        capacity = len(self._data["id"])
+        if self._size + extra <= capacity:
+            return
+        new_capacity = max(capacity * 2, self._size + extra)
+        for name, column in self._data.items():
+            new_column = np.empty(new_capacity, dtype=column.dtype)
+            new_column[: self._size] = column[: self._size]
+            self._data[name] = new_column
+        new_emb = np.empty((new_capacity, self._emb.shape[1]), dtype=self._emb.dtype)
+        new_emb[: self._size] = self._emb[: self._size]
+        self._emb = new_emb
+
+    def append(
+        self,
+        ids: List[int],
+        text: List[str],
+        emb: np.ndarray,
+        important_score: Iterable[float],
+        recency_score: Iterable[float],
+        compound_score: Iterable[float],
+        date: Union[date, Iterable[date]],
+        step: int,
+        delta: Union[int, Iterable[int]] = 0,
+        access_counter: Union[int, Iterable[int]] = 0,
+    ) -> None:
+        n = len(ids)
+        if n == 0:
+            return
+        self._reserve(n)
+        start, end = self._size, self._size + n
+        self._data["id"][start:end] = ids
+        self._data["important_score"][start:end] = important_score
+        self._data["recency_score"][start:end] = recency_score
+        self._data["delta"][start:end] = delta
+        self._data["important_score_recency_compound_score"][start:end] = (
+            compound_score
+        )
+        self._data["access_counter"][start:end] = access_counter
+        self._data["date"][start:end] = date
+        self._data["step"][start:end] = step
+        self._data["clean_up_step"][start:end] = self.NEVER
+        self._data["jump_step"][start:end] = self.NEVER
+        self._data["alive"][start:end] = True
+        self._emb[start:end] = self._encode_emb(emb)
+        self.text.extend(text)
+        for row, cur_id in enumerate(ids, start=start):
+            self.id_to_row[int(cur_id)] = row
+        self._size = end
+        self._live += n
+
+    def append_records(
+        self, records: List[Dict[str, Any]], emb: np.ndarray, step: int
+    ) -> None:
+        if not records:
+            return
+        self.append(
+            ids=[r["id"] for r in records],
+            text=[r["text"] for r in records],
+            emb=emb,
+            important_score=[r["important_score"] for r in records],
+            recency_score=[r["recency_score"] for r in records],
+            compound_score=[
+                r["important_score_recency_compound_score"] for r in records
+            ],
+            date=[r["date"] for r in records],
+            step=step,
+            delta=[r["delta"] for r in records],
+            access_counter=[r["access_counter"] for r in records],
+        )
+
+    @classmethod
+    def from_records(
+        cls,
+        records: List[Dict[str, Any]],
+        emb: np.ndarray,
+        step: int = 0,
+        storage: str = "float32",
+    ) -> "ScoreMemory":
+        obj = cls(
+            emb_dim=emb.shape[1], capacity=max(len(records), 16), storage=storage
+        )
+        obj.append_records(records, emb=emb, step=step)
+        return obj
+
+    def rows_of(self, ids: Iterable[int]) -> np.ndarray:
+        return np.fromiter(
+            (self.id_to_row[int(i)] for i in ids), dtype=np.int64
+        )
+
+    def record(self, row: int) -> Dict[str, Any]:
+        return {
+            "text": self.text[row],
+            "id": int(self._data["id"][row]),
+            "important_score": float(self._data["important_score"][row]),
+            "recency_score": float(self._data["recency_score"][row]),
+            "delta": int(self._data["delta"][row]),
+            "important_score_recency_compound_score": float(
+                self._data["important_score_recency_compound_score"][row]
+            ),
+            "access_counter": int(self._data["access_counter"][row]),
+            "date": self._data["date"][row].item(),
+        }
+
+    def records(self, rows: Iterable[int]) -> List[Dict[str, Any]]:
+        return [self.record(int(row)) for row in rows]
+
+    def live_rows(self) -> np.ndarray:
+        return np.flatnonzero(self.alive)
+
+    def sorted_rows(self) -> np.ndarray:
+        """Live row positions in ascending compound score order, ties kept in insertion order."""
+        rows = self.live_rows()
+        return rows[np.argsort(self.compound_score[rows], kind="stable")]
+
+    def remove_rows(self, rows: Union[np.ndarray, List[int]]) -> None:
+        rows = np.unique(rows)
+        if len(rows) == 0:
+            return
+        self.alive[rows] = False
+        for cur_id in self.id[rows].tolist():
+            del self.id_to_row[cur_id]
+        self._live -= len(rows)
+        if self._live * 2 < self._size:
+            self.compact()
+
+    def compact(self) -> None:
+        """Drops dead rows; row positions of live rows change."""
+        keep = self.alive.copy()
+        for name, column in self._data.items():
+            column[: self._live] = column[: self._size][keep]
+        self._emb[: self._live] = self._emb[: self._size][keep]
+        self.text = [t for t, k in zip(self.text, keep) if k]
+        self._size = self._live
+        self.id_to_row = {
+            int(cur_id): row for row, cur_id in enumerate(self.id.tolist())
+        }
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # only persist live rows of the filled part of the buffers
+        keep = self.alive
+        return {
+            "data": {
+                name: column[: self._size][keep].copy()
+                for name, column in self._data.items()
+            },
+            "emb": self._emb[: self._size][keep].copy(),
+            "storage": self.storage,
+            "text": [t for t, k in zip(self.text, keep) if k],
+        }
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self._data = state["data"]
+        self._emb = state["emb"]
+        self.storage = state.get("storage", "float32")
+        self.text = state["text"]
+        self._size = self._live = len(self.text)
+        self.id_to_row = {
+            int(cur_id): row for row, cur_id in enumerate(self.id.tolist())
+        }
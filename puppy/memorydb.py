@@ -1,5 +1,6 @@
 import os
 import faiss
+import heapq
 import pickle
 import faiss
 import logging
@@ -7,8 +8,10 @@ import shutil
 import numpy as np
 from datetime import date
 from itertools import repeat
-from sortedcontainers import SortedList
-from .embedding import LocalLongTextEmbedder
+from concurrent.futures import ThreadPoolExecutor
+from .embedding import get_embedder
+from .memory_index import MemoryIndex
+from .memory_store import ScoreMemory
 from typing import List, Union, Dict, Any, Tuple, Callable
 from .memory_functions import (
     ImportanceScoreInitialization,
@@ -46,6 +49,10 @@ class MemoryDB:  # can possibly take multiple symbols
         clean_up_threshold_dict: Dict[
             str, float
         ],  # {"recency_threshold": x, "importance_threshold": y"}
+        index_params: Union[Dict[str, Any], None] = None,  # see MemoryIndex
+        vector_params: Union[
+            Dict[str, Any], None
+        ] = None,  # {"storage": "float32" | "float16" | "sq8", "dim": None | int}
     ) -> None:
         # db attributes
         self.db_name = db_name
@@ -53,9 +60,15 @@ class MemoryDB:  # can possibly take multiple symbols
         self.jump_threshold_upper = jump_threshold_upper
         self.jump_threshold_lower = jump_threshold_lower
         self.emb_config = emb_config
-        self.emb_func = LocalLongTextEmbedder(**self.emb_config)
+        # shared with every other layer and agent using the same emb_config
+        self.emb_func = get_embedder(self.emb_config)
         # self.emb_func = OpenAILongerThanContextEmb(**self.config["agent"]["agent_1"]["embedding"]["detail"])
-        self.emb_dim = self.emb_func.get_embedding_dimension()
+        self.vector_params = {} if vector_params is None else dict(vector_params)
+        self.storage = self.vector_params.get("storage", "float32")
+        # Matryoshka-style truncation, only the leading `dim` components are kept
+        self.emb_dim = self.vector_params.get("dim") or (
+            self.emb_func.get_embedding_dimension()
+        )
         self.importance_score_initialization_func = importance_score_initialization
         self.recency_score_initialization_func = recency_score_initialization
         self.compound_score_calculation_func = compound_score_calculation
@@ -64,24 +77,32 @@ class MemoryDB:  # can possibly take multiple symbols
             importance_score_change_access_counter
         )
         self.clean_up_threshold_dict = dict(clean_up_threshold_dict)
-        # records
+        self.index_params = {} if index_params is None else dict(index_params)
+        # records, scores are decayed lazily up to current_step
+        self.current_step = 0
         self.universe = {}
         self.logger = logger
 
     def add_new_symbol(self, symbol: str) -> None:
-        cur_index = faiss.IndexFlatIP(
-            self.emb_dim
-        )  # normalized inner product is cosine similarity
-        cur_index = faiss.IndexIDMap2(cur_index)
+        cur_index = MemoryIndex(
+            emb_dim=self.emb_dim, storage=self.storage, **self.index_params
+        )
         temp_record = {
-            "score_memory": SortedList(
-                key=lambda x: x["important_score_recency_compound_score"]
-            ),
+            "score_memory": ScoreMemory(emb_dim=self.emb_dim, storage=self.storage),
             "index": cur_index,
+            # min-heaps of (step, id) for the next clean-up / jump check of each record
+            "clean_up_queue": [],
+            "jump_queue": [],
         }
         self.universe[symbol] = temp_record
 
-    def add_memory(self, symbol: str, date: date, text: Union[List[str], str]) -> None:
+    def add_memory(
+        self,
+        symbol: str,
+        date: date,
+        text: Union[List[str], str],
+        emb: Union[np.ndarray, None] = None,  # precomputed, one row per text
+    ) -> None:
         # add new symbol if not exist
         if symbol not in self.universe:
             self.add_new_symbol(symbol)
@@ -89,38 +110,39 @@ class MemoryDB:  # can possibly take multiple symbols
         if isinstance(text, str):
             text = [text]
         # get embedding
-        emb = self.emb_func(text)
+        if emb is None:
+            emb = self.emb_func(text)
+        else:
+            emb = np.array(emb, dtype=np.float32).reshape(len(text), -1)
+        emb = np.ascontiguousarray(emb[:, : self.emb_dim])
         faiss.normalize_L2(emb)
         ids = [self.id_generator() for _ in range(len(text))]
         # initialize importance score
-        importance_scores = [
-            self.importance_score_initialization_func() for _ in range(len(text))
-        ]
+        importance_scores = self.importance_score_initialization_func.sample_array(
+            len(text)
+        )
         # recency
-        recency_scores = [
-            self.recency_score_initialization_func() for _ in range(len(text))
-        ]
+        recency_scores = self.recency_score_initialization_func.sample_array(len(text))
         # calculate partial score
-        partial_scores = [
-            self.compound_score_calculation_func.recency_and_importance_score(
-                recency_score=cur_r, importance_score=cur_i
+        partial_scores = (
+            self.compound_score_calculation_func.recency_and_importance_score_array(
+                recency_score=recency_scores, importance_score=importance_scores
             )
-            for cur_i, cur_r in zip(importance_scores, recency_scores)
-        ]
+        )
         self.universe[symbol]["index"].add_with_ids(emb, np.array(ids))
+        self.universe[symbol]["score_memory"].append(
+            ids=ids,
+            text=text,
+            emb=emb,
+            important_score=importance_scores,
+            recency_score=recency_scores,
+            compound_score=partial_scores,
+            date=date,
+            step=self.current_step,
+        )
+        self._maintain_index(symbol)
+        self._schedule(symbol, self.universe[symbol]["score_memory"].rows_of(ids))
         for i in range(len(text)):
-            self.universe[symbol]["score_memory"].add(
-                {
-                    "text": text[i],
-                    "id": ids[i],
-                    "important_score": importance_scores[i],
-                    "recency_score": recency_scores[i],
-                    "delta": 0,
-                    "important_score_recency_compound_score": partial_scores[i],
-                    "access_counter": 0,
-                    "date": date,
-                }
-            )
             # log
             self.logger.info(
                 {
@@ -136,7 +158,11 @@ class MemoryDB:  # can possibly take multiple symbols
             )
 
     def query(
-        self, query_text: str, top_k: int, symbol: str
+        self,
+        query_text: str,
+        top_k: int,
+        symbol: str,
+        emb: Union[np.ndarray, None] = None,  # precomputed embedding of query_text
     ) -> Tuple[List[str], List[int]]:
         if (
             (symbol not in self.universe)
@@ -147,73 +173,31 @@ class MemoryDB:  # can possibly take multiple symbols
         max_len = len(self.universe[symbol]["score_memory"])
         top_k = min(top_k, max_len)
         cur_index = self.universe[symbol]["index"]
-        emb = self.emb_func(query_text)
-        # temp dict ranking
-        temp_text_list = []
-        temp_score = []
-        temp_date_list = []
-        temp_ids = []
+        cur_memory = self.universe[symbol]["score_memory"]
+        self._materialize(cur_memory)
+        if emb is None:
+            emb = self.emb_func(query_text)
+        if emb.shape[1] > self.emb_dim:
+            # truncate, keeping the norm of the (unnormalized) query embedding
+            full_norm = np.linalg.norm(emb, axis=1, keepdims=True)
+            emb = np.ascontiguousarray(emb[:, : self.emb_dim])
+            emb *= full_norm / np.linalg.norm(emb, axis=1, keepdims=True)
         # top 5 similar query: part 1 search
-        p1_dists, p1_ids = cur_index.search(emb, top_k)
-        p1_dists, p1_ids = p1_dists[0].tolist(), p1_ids[0].tolist()
-        for cur_sim, cur_id in zip(p1_dists, p1_ids):
-            cur_record = next(
-                (
-                    record
-                    for record in self.universe[symbol]["score_memory"]
-                    if record["id"] == cur_id
-                ),
-                None,
-            )
-            temp_text_list.append(cur_record["text"])  # type: ignore
-            temp_date_list.append(cur_record["date"])  # type: ignore
-            temp_ids.append(cur_record["id"])  # type: ignore
-            temp_score.append(
-                self.compound_score_calculation_func.merge_score(
-                    cur_sim, cur_record["important_score_recency_compound_score"]  # type: ignore
-                )
-            )
+        _, p1_ids = cur_index.search(emb, top_k)
+        p1_rows = cur_memory.rows_of(p1_ids[0][p1_ids[0] >= 0])
         # top 5 partial compound score: part 2 search
-        p2_ids = [self.universe[symbol]["score_memory"][i]["id"] for i in range(top_k)]
-        temp_arrays = [cur_index.reconstruct(i) for i in p2_ids]
-        p2_emb = np.vstack(temp_arrays)
-        temp_index = faiss.IndexFlatIP(self.emb_dim)
-        temp_index = faiss.IndexIDMap2(temp_index)
-        temp_index.add_with_ids(p2_emb, np.array(p2_ids))  # type: ignore
-        p2_dist, p2_ids = temp_index.search(emb, top_k)  # type: ignore
-        p2_dist, p2_ids = p2_dist[0].tolist(), p2_ids[0].tolist()
-        for cur_sim, cur_id in zip(p2_dist, p2_ids):
-            cur_record = next(
-                (
-                    record
-                    for record in self.universe[symbol]["score_memory"]
-                    if record["id"] == cur_id
-                ),
-                None,
-            )
-            temp_text_list.append(cur_record["text"])  # type: ignore
-            temp_date_list.append(cur_record["date"])  # type: ignore
-            temp_ids.append(cur_record["id"])  # type: ignore
-            temp_score.append(
-                self.compound_score_calculation_func.merge_score(
-                    cur_sim, cur_record["important_score_recency_compound_score"]  # type: ignore
-                )
-            )
-        # rank sort
-        score_rank = np.argsort(temp_score)[::-1][:top_k]
+        p2_rows = cur_memory.sorted_rows()[:top_k]
+        # score both candidate sets in one pass over the stored embeddings
+        candidate_rows = np.concatenate([p1_rows, p2_rows])
+        candidate_score = self.compound_score_calculation_func.merge_score_array(
+            cur_memory.emb_rows(candidate_rows) @ emb[0],
+            cur_memory.compound_score[candidate_rows],
+        )
+        # rank
+        score_rank = np.argpartition(-candidate_score, top_k - 1)[:top_k]
         # filter unique list
-        temp_ret_text_list = [temp_text_list[i] for i in score_rank]
-        temp_ret_date_list = [temp_date_list[i] for i in score_rank]
-        temp_ret_ids = [temp_ids[i] for i in score_rank]
-        ret_text_list = []
-        ret_date_list = []
-        ret_ids = []
-        _, unique_index = np.unique(temp_ret_ids, return_index=True)
-        unique_index = unique_index.tolist()
-        for i in unique_index:
-            ret_text_list.append(temp_ret_text_list[i])
-            ret_date_list.append(temp_ret_date_list[i])
-            ret_ids.append(temp_ret_ids[i])
+        ret_ids = np.unique(cur_memory.id[candidate_rows[score_rank]]).tolist()
+        ret_text_list = [cur_memory.text[i] for i in cur_memory.rows_of(ret_ids)]
 
         return ret_text_list, ret_ids
 
@@ -223,79 +207,163 @@ class MemoryDB:  # can possibly take multiple symbols
         if symbol not in self.universe:
             return []
         success_ids = []
-        cur_score_memory = self.universe[symbol]["score_memory"]
+        cur_memory = self.universe[symbol]["score_memory"]
         for cur_id, cur_feedback in zip(ids, feedback):
-            for cur_record in cur_score_memory:
-                if cur_record["id"] == cur_id:
-                    cur_record["access_counter"] += cur_feedback
-                    cur_record["important_score"] = (
-                        self.importance_score_change_access_counter(
-                            access_counter=cur_record["access_counter"],
-                            importance_score=cur_record["important_score"],
-                        )
-                    )
-                    cur_record["important_score_recency_compound_score"] = (
-                        self.compound_score_calculation_func.recency_and_importance_score(
-                            recency_score=cur_record["recency_score"],
-                            importance_score=cur_record["important_score"],
-                        )
-                    )
-                    success_ids.append(cur_id)
-                    break
-        self.universe[symbol]["score_memory"] = cur_score_memory
-        return success_ids
-
-    def _decay(self) -> None:
-        # 1. decay importance score
-        # 2. decay recency score
-        for cur_symbol in self.universe:
-            cur_score_memory = self.universe[cur_symbol]["score_memory"]
-            for i in range(len(cur_score_memory)):
-                (
-                    cur_score_memory[i]["recency_score"],
-                    cur_score_memory[i]["important_score"],
-                    cur_score_memory[i]["delta"],
-                ) = self.decay_function(
-                    important_score=cur_score_memory[i]["important_score"],
-                    delta=cur_score_memory[i]["delta"],
+            if (cur_row := cur_memory.id_to_row.get(cur_id)) is None:
+                continue
+            # re-base the record on the current step before changing its importance
+            self._materialize(cur_memory, rows=np.array([cur_row]))
+            cur_memory.access_counter[cur_row] += cur_feedback
+            cur_memory.important_score[cur_row] = (
+                self.importance_score_change_access_counter(
+                    access_counter=cur_memory.access_counter[cur_row],
+                    importance_score=cur_memory.important_score[cur_row],
                 )
-                cur_score_memory[i]["important_score_recency_compound_score"] = (
-                    self.compound_score_calculation_func.recency_and_importance_score(
-                        recency_score=cur_score_memory[i]["recency_score"],
-                        importance_score=cur_score_memory[i]["important_score"],
-                    )
+            )
+            cur_memory.compound_score[cur_row] = (
+                self.compound_score_calculation_func.recency_and_importance_score(
+                    recency_score=cur_memory.recency_score[cur_row],
+                    importance_score=cur_memory.important_score[cur_row],
                 )
-            self.universe[cur_symbol]["score_memory"] = cur_score_memory
+            )
+            self._schedule(symbol, np.array([cur_row]))
+            success_ids.append(cur_id)
+        return success_ids
+
+    def records(self, symbol: str) -> List[Dict[str, Any]]:
+        """Current records of a symbol in ascending compound score order."""
+        if symbol not in self.universe:
+            return []
+        cur_memory = self.universe[symbol]["score_memory"]
+        self._materialize(cur_memory)
+        return list(cur_memory)
+
+    def _maintain_index(self, symbol: str) -> None:
+        """Trains or compacts an approximate index from the stored embeddings when due."""
+        cur_index = self.universe[symbol]["index"]
+        if cur_index.needs_rebuild():
+            cur_memory = self.universe[symbol]["score_memory"]
+            live_rows = cur_memory.live_rows()
+            cur_index.rebuild(
+                cur_memory.emb_rows(live_rows), cur_memory.id[live_rows]
+            )
+
+    def _materialize(
+        self, cur_memory: ScoreMemory, rows: Union[np.ndarray, None] = None
+    ) -> None:
+        # bring stored scores up to current_step with the closed-form decay
+        if rows is None:
+            rows = np.flatnonzero(
+                cur_memory.alive & (cur_memory.step != self.current_step)
+            )
+        else:
+            rows = rows[cur_memory.step[rows] != self.current_step]
+        if len(rows) == 0:
+            return
+        (
+            cur_memory.recency_score[rows],
+            cur_memory.important_score[rows],
+            cur_memory.delta[rows],
+        ) = self.decay_function.decay_steps_array(
+            important_score=cur_memory.important_score[rows],
+            delta=cur_memory.delta[rows],
+            steps=self.current_step - cur_memory.step[rows],
+        )
+        cur_memory.compound_score[rows] = (
+            self.compound_score_calculation_func.recency_and_importance_score_array(
+                recency_score=cur_memory.recency_score[rows],
+                importance_score=cur_memory.important_score[rows],
+            )
+        )
+        cur_memory.step[rows] = self.current_step
+
+    def _due_step(self, steps: np.ndarray) -> np.ndarray:
+        # schedule one step early so float rounding never delays a check
+        finite = np.isfinite(steps)
+        due = np.full(len(steps), ScoreMemory.NEVER, dtype=np.int64)
+        due[finite] = self.current_step + np.maximum(steps[finite] - 1, 0)
+        return due
+
+    def _schedule(self, symbol: str, rows: np.ndarray) -> None:
+        # rows must be materialized at current_step
+        if len(rows) == 0:
+            return
+        cur_record = self.universe[symbol]
+        cur_memory = cur_record["score_memory"]
+        important_score = cur_memory.important_score[rows]
+        clean_up_steps = np.minimum(
+            self.decay_function.steps_until_recency_below(
+                recency_score=cur_memory.recency_score[rows],
+                delta=cur_memory.delta[rows],
+                threshold=self.clean_up_threshold_dict["recency_threshold"],
+            ),
+            self.decay_function.steps_until_importance_below(
+                important_score=important_score,
+                threshold=self.clean_up_threshold_dict["importance_threshold"],
+            ),
+        )
+        jump_steps = np.minimum(
+            self.decay_function.steps_until_importance_at_least(
+                important_score=important_score, threshold=self.jump_threshold_upper
+            ),
+            self.decay_function.steps_until_importance_below(
+                important_score=important_score, threshold=self.jump_threshold_lower
+            ),
+        )
+        cur_memory.clean_up_step[rows] = self._due_step(clean_up_steps)
+        cur_memory.jump_step[rows] = self._due_step(jump_steps)
+        for queue, due_steps in [
+            (cur_record["clean_up_queue"], cur_memory.clean_up_step[rows]),
+            (cur_record["jump_queue"], cur_memory.jump_step[rows]),
+        ]:
+            for due, cur_id in zip(due_steps.tolist(), cur_memory.id[rows].tolist()):
+                if due != ScoreMemory.NEVER:
+                    heapq.heappush(queue, (due, cur_id))
+
+    def _pop_due(
+        self, symbol: str, queue_name: str, scheduled_steps: np.ndarray
+    ) -> np.ndarray:
+        # pop records whose check is due, skipping entries superseded by a reschedule
+        queue = self.universe[symbol][queue_name]
+        id_to_row = self.universe[symbol]["score_memory"].id_to_row
+        due_rows = []
+        while queue and queue[0][0] <= self.current_step:
+            due, cur_id = heapq.heappop(queue)
+            cur_row = id_to_row.get(cur_id)
+            if (cur_row is not None) and (scheduled_steps[cur_row] == due):
+                due_rows.append(cur_row)
+        return np.unique(np.array(due_rows, dtype=np.int64))
 
     def _clean_up(self) -> List[int]:
         ret_removed_ids = []
         for cur_symbol in self.universe:
-            cur_score_memory = self.universe[cur_symbol]["score_memory"]
-            if remove_ids := [
-                cur_score_memory[i]["id"]
-                for i in range(len(cur_score_memory))
-                if (
-                    cur_score_memory[i]["recency_score"]
-                    < self.clean_up_threshold_dict["recency_threshold"]
-                )
-                or (
-                    cur_score_memory[i]["important_score"]
-                    < self.clean_up_threshold_dict["importance_threshold"]
-                )
-            ]:
-                new_list = SortedList(
-                    [], key=lambda x: x["important_score_recency_compound_score"]
-                )
-                for cur_object in cur_score_memory:
-                    if cur_object["id"] not in remove_ids:
-                        new_list.add(cur_object)
-                self.universe[cur_symbol]["score_memory"] = new_list
+            cur_memory = self.universe[cur_symbol]["score_memory"]
+            due_rows = self._pop_due(
+                cur_symbol, "clean_up_queue", cur_memory.clean_up_step
+            )
+            if len(due_rows) == 0:
+                continue
+            self._materialize(cur_memory, rows=due_rows)
+            remove_mask = (
+                cur_memory.recency_score[due_rows]
+                < self.clean_up_threshold_dict["recency_threshold"]
+            ) | (
+                cur_memory.important_score[due_rows]
+                < self.clean_up_threshold_dict["importance_threshold"]
+            )
+            self._schedule(cur_symbol, due_rows[~remove_mask])
+            remove_rows = due_rows[remove_mask]
+            if len(remove_rows) > 0:
+                remove_ids = cur_memory.id[remove_rows].tolist()
+                cur_memory.remove_rows(remove_rows)
                 self.universe[cur_symbol]["index"].remove_ids(np.array(remove_ids))
+                self._maintain_index(cur_symbol)
                 ret_removed_ids.extend(remove_ids)
         return ret_removed_ids
 
     def step(self) -> List[int]:
-        self._decay()
+        # decay is only applied when scores are needed
+        self.current_step += 1
         return self._clean_up()
 
     def prepare_jump(
@@ -305,52 +373,41 @@ class MemoryDB:  # can possibly take multiple symbols
         jump_dict_down = {}
         id_to_remove = []
         for cur_symbol in self.universe:
-            temp_delete_ids_up = []
-            temp_jump_object_list_up = []
-            temp_emb_list_up = []
-            temp_delete_ids_down = []
-            temp_jump_object_list_down = []
-            temp_emb_list_down = []
-            cur_score_memory = self.universe[cur_symbol]["score_memory"]
-            for i in range(len(cur_score_memory)):
-                if cur_score_memory[i]["important_score"] >= self.jump_threshold_upper:
-                    temp_delete_ids_up.append(cur_score_memory[i]["id"])
-                    temp_jump_object_list_up.append(cur_score_memory[i])
-                    temp_emb_list_up.append(
-                        self.universe[cur_symbol]["index"].reconstruct(
-                            cur_score_memory[i]["id"]
-                        )
-                    )
-                if cur_score_memory[i]["important_score"] < self.jump_threshold_lower:
-                    temp_delete_ids_down.append(cur_score_memory[i]["id"])
-                    temp_jump_object_list_down.append(cur_score_memory[i])
-                    temp_emb_list_down.append(
-                        self.universe[cur_symbol]["index"].reconstruct(
-                            cur_score_memory[i]["id"]
-                        )
-                    )
+            cur_memory = self.universe[cur_symbol]["score_memory"]
+            cur_index = self.universe[cur_symbol]["index"]
+            due_rows = self._pop_due(cur_symbol, "jump_queue", cur_memory.jump_step)
+            if len(due_rows) == 0:
+                continue
+            self._materialize(cur_memory, rows=due_rows)
+            # jumping records leave in compound score order
+            due_rows = due_rows[
+                np.argsort(cur_memory.compound_score[due_rows], kind="stable")
+            ]
+            due_important_score = cur_memory.important_score[due_rows]
+            up_mask = due_important_score >= self.jump_threshold_upper
+            down_mask = due_important_score < self.jump_threshold_lower
+            self._schedule(cur_symbol, due_rows[~(up_mask | down_mask)])
+            rows_up = due_rows[up_mask]
+            rows_down = due_rows[down_mask]
+            temp_delete_ids_up = cur_memory.id[rows_up].tolist()
+            temp_delete_ids_down = cur_memory.id[rows_down].tolist()
             temp_delete_ids = temp_delete_ids_up + temp_delete_ids_down
+            if not temp_delete_ids:
+                continue
             id_to_remove.extend(temp_delete_ids)
-            self.universe[cur_symbol]["index"].remove_ids(np.array(temp_delete_ids))
-            new_memory = SortedList(
-                [], key=lambda x: x["important_score_recency_compound_score"]
-            )
-            for record in cur_score_memory:
-                if record["id"] not in temp_delete_ids:
-                    new_memory.add(record)
-            self.universe[cur_symbol]["score_memory"] = new_memory
-            if temp_jump_object_list_up:
-                temp_emb_list_up = np.vstack(temp_emb_list_up)
+            if temp_delete_ids_up:
                 jump_dict_up[cur_symbol] = {
-                    "jump_object_list": temp_jump_object_list_up,
-                    "emb_list": temp_emb_list_up,
+                    "jump_object_list": cur_memory.records(rows_up),
+                    "emb_list": cur_memory.emb_rows(rows_up),
                 }
-            if temp_jump_object_list_down:
-                temp_emb_list_down = np.vstack(temp_emb_list_down)
+            if temp_delete_ids_down:
                 jump_dict_down[cur_symbol] = {
-                    "jump_object_list": temp_jump_object_list_down,
-                    "emb_list": temp_emb_list_down,
+                    "jump_object_list": cur_memory.records(rows_down),
+                    "emb_list": cur_memory.emb_rows(rows_down),
                 }
+            cur_index.remove_ids(np.array(temp_delete_ids))
+            cur_memory.remove_rows(np.concatenate([rows_up, rows_down]))
+            self._maintain_index(cur_symbol)
         return jump_dict_up, jump_dict_down, id_to_remove
 
     def accept_jump(self, jump_dict: Dict[str, Dict[str, Any]], direction: str) -> None:
@@ -370,12 +427,18 @@ class MemoryDB:  # can possibly take multiple symbols
                         self.recency_score_initialization_func()
                     )
                     cur_object["delta"] = 0
-            self.universe[cur_symbol]["score_memory"].update(
-                jump_dict[cur_symbol]["jump_object_list"]
+            self.universe[cur_symbol]["score_memory"].append_records(
+                jump_dict[cur_symbol]["jump_object_list"],
+                emb=jump_dict[cur_symbol]["emb_list"],
+                step=self.current_step,
+            )
+            self._schedule(
+                cur_symbol, self.universe[cur_symbol]["score_memory"].rows_of(new_ids)
             )
             self.universe[cur_symbol]["index"].add_with_ids(
                 jump_dict[cur_symbol]["emb_list"], np.array(new_ids)
             )
+            self._maintain_index(cur_symbol)
 
     def save_checkpoint(self, name: str, path: str, force: bool = False) -> None:
         if os.path.exists(os.path.join(path, name)):
@@ -397,6 +460,9 @@ class MemoryDB:  # can possibly take multiple symbols
             "decay_function": self.decay_function,
             "importance_score_change_access_counter": self.importance_score_change_access_counter,
             "clean_up_threshold_dict": self.clean_up_threshold_dict,
+            "index_params": self.index_params,
+            "vector_params": self.vector_params,
+            "current_step": self.current_step,
             "logger": self.logger,
         }
         with open(os.path.join(path, name, "state_dict.pkl"), "wb") as f:
@@ -405,12 +471,17 @@ class MemoryDB:  # can possibly take multiple symbols
         save_universe = {}
         for cur_symbol in self.universe:
             cur_record = self.universe[cur_symbol]
-            faiss.write_index(
-                self.universe[cur_symbol]["index"],
-                os.path.join(path, name, f"{cur_symbol}.index"),
-            )
+            cur_index = cur_record["index"]
+            if cur_index.deleted or cur_index.stale:
+                # tombstones are not written, drop them first
+                live_rows = cur_record["score_memory"].live_rows()
+                cur_index.rebuild(
+                    cur_record["score_memory"].emb_rows(live_rows),
+                    cur_record["score_memory"].id[live_rows],
+                )
+            cur_index.save(os.path.join(path, name, f"{cur_symbol}.index"))
             save_universe[cur_symbol] = {
-                "score_memory": list(cur_record["score_memory"]),
+                "score_memory": cur_record["score_memory"],
                 "index_save_path": os.path.join(path, name, f"{cur_symbol}.index"),
             }
         with open(os.path.join(path, name, "universe_index.pkl"), "wb") as f:
@@ -424,14 +495,26 @@ class MemoryDB:  # can possibly take multiple symbols
         # load universe
         with open(os.path.join(path, "universe_index.pkl"), "rb") as f:
             universe = pickle.load(f)
+        index_params = state_dict.get("index_params", {})
+        vector_params = state_dict.get("vector_params", {})
+        storage = vector_params.get("storage", "float32")
         for cur_symbol in universe:
-            universe[cur_symbol]["index"] = faiss.read_index(
-                universe[cur_symbol]["index_save_path"]
-            )
-            universe[cur_symbol]["score_memory"] = SortedList(
-                universe[cur_symbol]["score_memory"],
-                key=lambda x: x["important_score_recency_compound_score"],
+            universe[cur_symbol]["index"] = MemoryIndex.load(
+                universe[cur_symbol]["index_save_path"],
+                storage=storage,
+                **index_params,
             )
+            if isinstance(universe[cur_symbol]["score_memory"], list):
+                # checkpoints written before the columnar store hold a list of records
+                records = universe[cur_symbol]["score_memory"]
+                cur_index = universe[cur_symbol]["index"].index
+                universe[cur_symbol]["score_memory"] = ScoreMemory.from_records(
+                    records,
+                    emb=np.vstack(
+                        [cur_index.reconstruct(r["id"]) for r in records]
+                    ).reshape(len(records), cur_index.d),
+                    storage=storage,
+                )
             del universe[cur_symbol]["index_save_path"]
         # create object
         obj = cls(
@@ -452,9 +535,19 @@ class MemoryDB:  # can possibly take multiple symbols
             ],
             decay_function=state_dict["decay_function"],
             clean_up_threshold_dict=state_dict["clean_up_threshold_dict"],
+            index_params=index_params,
+            vector_params=vector_params,
             logger=state_dict["logger"],
         )
+        obj.current_step = state_dict.get("current_step", 0)
         obj.universe = universe.copy()
+        # queues are not saved, rebuild them from the records
+        for cur_symbol in obj.universe:
+            cur_memory = obj.universe[cur_symbol]["score_memory"]
+            obj.universe[cur_symbol]["clean_up_queue"] = []
+            obj.universe[cur_symbol]["jump_queue"] = []
+            obj._materialize(cur_memory)
+            obj._schedule(cur_symbol, cur_memory.live_rows())
         return obj
 
 
@@ -525,6 +618,8 @@ class BrainDB:
                 **config["short"]["decay_params"],
             ),
             clean_up_threshold_dict=config["short"]["clean_up_threshold_dict"],
+            index_params=config["short"].get("index_params"),
+            vector_params=config["short"].get("vector_params"),
             logger=logger,
         )
         mid_term_memory = MemoryDB(
@@ -542,6 +637,8 @@ class BrainDB:
             importance_score_change_access_counter=LinearImportanceScoreChange(),
             decay_function=ExponentialDecay(**config["mid"]["decay_params"]),
             clean_up_threshold_dict=config["mid"]["clean_up_threshold_dict"],
+            index_params=config["mid"].get("index_params"),
+            vector_params=config["mid"].get("vector_params"),
             logger=logger,
         )
         long_term_memory = MemoryDB(
@@ -561,6 +658,8 @@ class BrainDB:
                 **config["long"]["decay_params"],
             ),
             clean_up_threshold_dict=config["long"]["clean_up_threshold_dict"],
+            index_params=config["long"].get("index_params"),
+            vector_params=config["long"].get("vector_params"),
             logger=logger,
         )
         reflection_memory = MemoryDB(
@@ -580,8 +679,24 @@ class BrainDB:
                 **config["reflection"]["decay_params"],
             ),
             clean_up_threshold_dict=config["reflection"]["clean_up_threshold_dict"],
+            index_params=config["reflection"].get("index_params"),
+            vector_params=config["reflection"].get("vector_params"),
             logger=logger,
         )
+        # records jump between these layers together with their vectors
+        if (
+            len(
+                {
+                    short_term_memory.emb_dim,
+                    mid_term_memory.emb_dim,
+                    long_term_memory.emb_dim,
+                }
+            )
+            > 1
+        ):
+            raise ValueError(
+                "vector_params dim must be the same for short, mid and long term memory"
+            )
         return cls(
             emb_config=emb_config,
             agent_name=agent_name,
@@ -594,24 +709,40 @@ class BrainDB:
         )
 
     def add_memory_short(
-        self, symbol: str, date: date, text: Union[List[str], str]
+        self,
+        symbol: str,
+        date: date,
+        text: Union[List[str], str],
+        emb: Union[np.ndarray, None] = None,
     ) -> None:
-        self.short_term_memory.add_memory(symbol, date, text)
+        self.short_term_memory.add_memory(symbol, date, text, emb)
 
     def add_memory_mid(
-        self, symbol: str, date: date, text: Union[List[str], str]
+        self,
+        symbol: str,
+        date: date,
+        text: Union[List[str], str],
+        emb: Union[np.ndarray, None] = None,
     ) -> None:
-        self.mid_term_memory.add_memory(symbol, date, text)
+        self.mid_term_memory.add_memory(symbol, date, text, emb)
 
     def add_memory_long(
-        self, symbol: str, date: date, text: Union[List[str], str]
+        self,
+        symbol: str,
+        date: date,
+        text: Union[List[str], str],
+        emb: Union[np.ndarray, None] = None,
     ) -> None:
-        self.long_term_memory.add_memory(symbol, date, text)
+        self.long_term_memory.add_memory(symbol, date, text, emb)
 
     def add_memory_reflection(
-        self, symbol: str, date: date, text: Union[List[str], str]
+        self,
+        symbol: str,
+        date: date,
+        text: Union[List[str], str],
+        emb: Union[np.ndarray, None] = None,
     ) -> None:
-        self.reflection_memory.add_memory(symbol, date, text)
+        self.reflection_memory.add_memory(symbol, date, text, emb)
 
     def query_short(
         self, query_text: str, top_k: int, symbol: str
@@ -633,6 +764,33 @@ class BrainDB:
     ) -> Tuple[List[str], List[int]]:
         return self.reflection_memory.query(query_text, top_k, symbol)
 
+    def query_all(
+        self, query_text: str, top_k: int, symbol: str
+    ) -> Dict[str, Tuple[List[str], List[int]]]:
+        """
+        Queries all four layers with a single embedding of query_text.
+        Returns {"short": (texts, ids), "mid": ..., "long": ..., "reflection": ...}.
+        """
+        layers = {
+            "short": self.short_term_memory,
+            "mid": self.mid_term_memory,
+            "long": self.long_term_memory,
+            "reflection": self.reflection_memory,
+        }
+        # all layers share emb_config, so any layer's embedder will do
+        emb = self.short_term_memory.emb_func(query_text)
+        # layers hold disjoint state and faiss releases the GIL while searching
+        with ThreadPoolExecutor(max_workers=len(layers)) as executor:
+            futures = {
+                layer_name: executor.submit(
+                    memory_db.query, query_text, top_k, symbol, emb
+                )
+                for layer_name, memory_db in layers.items()
+            }
+            return {
+                layer_name: future.result() for layer_name, future in futures.items()
+            }
+
     def update_access_count_with_feed_back(
         self, symbol: str, ids: Union[List[int], int], feedback: int
     ) -> None:
@@ -678,32 +836,25 @@ class BrainDB:
             )
         )
 
+    def _log_memory_layer(self, memory_db: MemoryDB, layer_name: str) -> None:
+        # dumping every record is O(N) per step, so it is only done at debug level
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        for cur_symbol in memory_db.universe:
+            self.logger.debug(f"{layer_name} {cur_symbol}")
+            for cur_record in memory_db.records(cur_symbol):
+                self.logger.debug(f"memory: {cur_record}")
+
     def step(self) -> None:
         # first decay then clean up
         self.removed_ids.extend(self.short_term_memory.step())
-        for cur_symbol in self.short_term_memory.universe:
-            cur_memory = self.short_term_memory.universe[cur_symbol]["score_memory"]
-            self.logger.info(f"short term memory {cur_symbol}")
-            for i in range(len(cur_memory)):
-                self.logger.info(f"memory: {cur_memory[i]}")
+        self._log_memory_layer(self.short_term_memory, "short term memory")
         self.removed_ids.extend(self.mid_term_memory.step())
-        for cur_symbol in self.mid_term_memory.universe:
-            cur_memory = self.mid_term_memory.universe[cur_symbol]["score_memory"]
-            self.logger.info(f"mid term memory {cur_symbol}")
-            for i in range(len(cur_memory)):
-                self.logger.info(f"memory: {cur_memory[i]}")
+        self._log_memory_layer(self.mid_term_memory, "mid term memory")
         self.removed_ids.extend(self.long_term_memory.step())
-        for cur_symbol in self.long_term_memory.universe:
-            cur_memory = self.long_term_memory.universe[cur_symbol]["score_memory"]
-            self.logger.info(f"long term memory {cur_symbol}")
-            for i in range(len(cur_memory)):
-                self.logger.info(f"memory: {cur_memory[i]}")
+        self._log_memory_layer(self.long_term_memory, "long term memory")
         self.removed_ids.extend(self.reflection_memory.step())
-        for cur_symbol in self.reflection_memory.universe:
-            cur_memory = self.reflection_memory.universe[cur_symbol]["score_memory"]
-            self.logger.info(f"reflection term memory {cur_symbol}")
-            for i in range(len(cur_memory)):
-                self.logger.info(f"memory: {cur_memory[i]}")
+        self._log_memory_layer(self.reflection_memory, "reflection term memory")
 
         # then jump
         self.logger.info("Memory jump starts...")
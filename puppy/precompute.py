@@ -0,0 +1,100 @@
+import numpy as np
+from datetime import date
+from typing import Dict, Any, List, Tuple, Union
+from .embedding import get_embedder
+
+# type alias
+env_emb_type = Dict[
+    str,
+    Any,  # {"emb_config": {...}, "data": {date: {"filing_k": {symbol: vec}, "filing_q": ..., "news": {symbol: (n, d)}}}}
+]
+
+
+def precompute_embeddings(
+    env_data_pkl: Dict[date, Dict[str, Any]],
+    emb_config: Dict[str, Any],
+    start_date: Union[date, None] = None,
+    end_date: Union[date, None] = None,
+    symbols: Union[List[str], None] = None,
+    docs_per_call: int = 1024,
+) -> env_emb_type:
+    """
+    Embeds every news item and filing of env_data_pkl between start_date and end_date
+    with the same embedder the memory layers use. The vectors are not normalized,
+    MemoryDB.add_memory does that, so they are exactly what it would compute itself.
+    Set num_workers in emb_config to spread the work over a process pool.
+    The vectors keep the embedder's full dimension, the memory layers truncate them
+    to vector_params.dim, so one file serves every dim setting.
+    """
+    embedder = get_embedder(emb_config)
+    # flatten every text into one list, remembering where it goes
+    texts: List[str] = []
+    slots: List[Tuple[date, str, str]] = []
+    for cur_date in sorted(env_data_pkl):
+        if ((start_date is not None) and (cur_date < start_date)) or (
+            (end_date is not None) and (cur_date > end_date)
+        ):
+            continue
+        for kind in ["filing_k", "filing_q", "news"]:
+            for symbol, content in env_data_pkl[cur_date].get(kind, {}).items():
+                if (symbols is not None) and (symbol not in symbols):
+                    continue
+                content = [content] if isinstance(content, str) else list(content)
+                texts.extend(content)
+                slots.extend([(cur_date, kind, symbol)] * len(content))
+    embs = [
+        embedder(texts[i : i + docs_per_call])
+        for i in range(0, len(texts), docs_per_call)
+    ]
+    embs = (
+        np.concatenate(embs)
+        if embs
+        else np.empty((0, embedder.get_embedding_dimension()), dtype=np.float32)
+    )
+
+    data: Dict[date, Dict[str, Dict[str, np.ndarray]]] = {}
+    start = 0
+    while start < len(slots):
+        end = start
+        while (end < len(slots)) and (slots[end] == slots[start]):
+            end += 1
+        cur_date, kind, symbol = slots[start]
+        cur_emb = embs[start:end]
+        data.setdefault(cur_date, {"filing_k": {}, "filing_q": {}, "news": {}})
+        # filings are a single text, news a list of texts
+        data[cur_date][kind][symbol] = cur_emb if kind == "news" else cur_emb[0]
+        start = end
+    return {
+        "emb_config": {**_embedder_metadata(embedder), "dim": embs.shape[1]},
+        "data": data,
+    }
+
+
+def _embedder_metadata(embedder: Any) -> Dict[str, Any]:
+    return {
+        "embedding_model": embedder.model_name,
+        "chunk_size": embedder.chunk_size,
+        # onnx and quantized vectors drift from torch ones, they must not be mixed
+        "backend": embedder.backend,
+        "onnx_quantize": embedder.onnx_quantize,
+    }
+
+
+def check_embeddings(
+    env_emb_pkl: env_emb_type,
+    emb_config: Dict[str, Any],
+) -> None:
+    """
+    Raises if the precomputed vectors were made by a different embedder than emb_config,
+    or with another backend or quantization. The stored dimension is not checked, the
+    vectors are full size whatever vector_params.dim is.
+    """
+    embedder = get_embedder(emb_config)
+    expected = _embedder_metadata(embedder)
+    # files written before the backend was recorded came from torch
+    found = {"backend": "torch", "onnx_quantize": None, **env_emb_pkl["emb_config"]}
+    found = {k: found[k] for k in expected if k in found}
+    if found != expected:
+        raise ValueError(
+            f"Precomputed embeddings use {found}, config expects {expected}"
+        )
@@ -0,0 +1,304 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+import httpx
+from typing import Awaitable, Callable, Dict, Any, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# statuses that mean the provider is overloaded, the request may be retried
+retry_status_codes = [429, 500, 502, 503, 504]
+
+
+class RateLimitDeadlineError(Exception):
+    pass
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate_per_minute`, holding at most `capacity` (by default
+    one minute of tokens). `reserve` takes tokens even when the bucket runs short and
+    returns how long the caller has to wait for them, so waiters queue up fairly.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Union[float, None] = None) -> None:
+        self.rate = rate_per_minute / 60
+        self.capacity = rate_per_minute if capacity is None else capacity
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # a request larger than the bucket waits for a full bucket
+            self._tokens -= min(amount, self.capacity)
+            return max(0.0, -self._tokens / self.rate)
+
+    def refund(self, amount: float) -> None:
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + min(amount, self.capacity))
+
+
+class AIMDConcurrency:
+    """
+    Concurrency limit adjusted by additive increase / multiplicative decrease: every
+    success raises the limit by about `increase` per window of `limit` requests, every
+    overload response multiplies it by `decrease`, at most once per `cooldown` seconds.
+    """
+
+    def __init__(
+        self,
+        initial: float = 4,
+        min_limit: float = 1,
+        max_limit: float = 32,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        cooldown: float = 1.0,
+    ) -> None:
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_decrease = float("-inf")
+        self._cond = threading.Condition()
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.in_flight < max(1, int(self.limit)):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self, timeout: Union[float, None] = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(self.try_acquire, timeout=timeout)
+
+    async def async_acquire(self, timeout: Union[float, None] = None) -> bool:
+        # the limit is shared with threads, so poll instead of awaiting a lock
+        end = None if timeout is None else time.monotonic() + timeout
+        delay = 0.005
+        while not self.try_acquire():
+            if (end is not None) and (time.monotonic() >= end):
+                return False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        return True
+
+    def release(self, overloaded: Union[bool, None]) -> None:
+        """Frees a slot, None when the request says nothing about the provider's load."""
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if overloaded is None:
+                pass
+            elif overloaded:
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+            self._cond.notify_all()
+
+
+class RateLimiter:
+    """
+    Client-side limiter for one LLM endpoint, shared by every ChatOpenAICompatible of
+    the process pointing at it (see get_rate_limiter). The budgets are per process:
+    concurrent runs on one provider quota, e.g. one `run.py sim` per ticker, each need
+    their share of it. Requests pass a requests/minute and a
+    tokens/minute bucket and an AIMD concurrency limit. 429, 5xx and transport errors
+    are retried with full-jitter exponential backoff, honouring Retry-After up to
+    `max_delay`, until `max_retries` or `deadline_seconds` after the first attempt. The
+    last response is returned when retries run out or Retry-After asks for longer than
+    `max_delay`, a wait that would pass the deadline raises RateLimitDeadlineError.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Union[float, None] = None,
+        tokens_per_minute: Union[float, None] = None,
+        max_concurrency: int = 32,
+        initial_concurrency: Union[int, None] = None,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        deadline_seconds: Union[float, None] = None,
+    ) -> None:
+        self.request_bucket = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.concurrency = AIMDConcurrency(
+            initial=max_concurrency if initial_concurrency is None else initial_concurrency,
+            max_limit=max_concurrency,
+        )
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline_seconds = deadline_seconds
+        self._rng = random.Random()
+        # counters, see stats, updated by the threads sharing the limiter
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.throttled_seconds = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "throttled_seconds": round(self.throttled_seconds, 3),
+                "concurrency_limit": round(self.concurrency.limit, 2),
+                "in_flight": self.concurrency.in_flight,
+            }
+
+    def _count(self, requests: int = 0, retries: int = 0, throttled: float = 0.0) -> None:
+        with self._stats_lock:
+            self.requests += requests
+            self.retries += retries
+            self.throttled_seconds += throttled
+
+    def _deadline(self) -> Union[float, None]:
+        if self.deadline_seconds is None:
+            return None
+        return time.monotonic() + self.deadline_seconds
+
+    @staticmethod
+    def _check_deadline(deadline: Union[float, None], wait: float) -> None:
+        if (deadline is not None) and (time.monotonic() + wait > deadline):
+            raise RateLimitDeadlineError(
+                f"Rate limit wait of {wait:.1f}s would pass the request deadline"
+            )
+
+    def _bucket_wait(self, n_tokens: int, deadline: Union[float, None]) -> float:
+        wait = 0.0
+        reserved = []
+        for bucket, amount in [(self.request_bucket, 1), (self.token_bucket, n_tokens)]:
+            if bucket is not None:
+                wait = max(wait, bucket.reserve(amount))
+                reserved.append((bucket, amount))
+        try:
+            self._check_deadline(deadline, wait)
+        except RateLimitDeadlineError:
+            for bucket, amount in reserved:
+                bucket.refund(amount)
+            raise
+        self._count(throttled=wait)
+        return wait
+
+    def _retry_delay(
+        self,
+        attempt: int,
+        response: Union[httpx.Response, None],
+        deadline: Union[float, None],
+    ) -> Union[float, None]:
+        """Backoff before the next attempt, None when the request should not be retried."""
+        if attempt >= self.max_retries:
+            return None
+        delay = self._rng.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get("Retry-After", 0))
+            except ValueError:
+                # an HTTP date, fall back to the backoff
+                retry_after = 0.0
+            if retry_after > self.max_delay:
+                # waiting less would only be refused again
+                return None
+            delay = max(delay, retry_after)
+        if (deadline is not None) and (time.monotonic() + delay > deadline):
+            return None
+        return delay
+
+    @staticmethod
+    def _outcome(
+        response: Union[httpx.Response, None], error: Union[Exception, None]
+    ) -> Tuple[Union[bool, None], bool]:
+        """(overloaded, retryable) for a response or transport error."""
+        if response is None and error is None:
+            # send raised something other than a transport error, e.g. a cancellation
+            return None, False
+        if error is not None:
+            # only a timeout says the provider is overloaded, e.g. a refused connection
+            # says nothing about its load
+            return (True if isinstance(error, httpx.TimeoutException) else None), True
+        overloaded = response.status_code in retry_status_codes  # type: ignore
+        return overloaded, overloaded
+
+    def call(self, send: Callable[[], httpx.Response], n_tokens: int = 0) -> httpx.Response:
+        deadline = self._deadline()
+        attempt = 0
+        while True:
+            time.sleep(self._bucket_wait(n_tokens, deadline))
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not self.concurrency.acquire(timeout=timeout):
+                raise RateLimitDeadlineError("No concurrency slot before the request deadline")
+            response, error = None, None
+            try:
+                response = send()
+            except httpx.TransportError as e:
+                error = e
+            finally:
+                overloaded, retryable = self._outcome(response, error)
+                self.concurrency.release(overloaded)
+            self._count(requests=1)
+            delay = self._retry_delay(attempt, response, deadline) if retryable else None
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response  # type: ignore
+            logger.info(f"LLM request failed ({error or response.status_code}), retry in {delay:.1f}s")  # type: ignore
+            self._count(retries=1)
+            attempt += 1
+            time.sleep(delay)
+
+    async def acall(
+        self, send: Callable[[], Awaitable[httpx.Response]], n_tokens: int = 0
+    ) -> httpx.Response:
+        deadline = self._deadline()
+        attempt = 0
+        while True:
+            await asyncio.sleep(self._bucket_wait(n_tokens, deadline))
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not await self.concurrency.async_acquire(timeout=timeout):
+                raise RateLimitDeadlineError("No concurrency slot before the request deadline")
+            response, error = None, None
+            try:
+                response = await send()
+            except httpx.TransportError as e:
+                error = e
+            finally:
+                overloaded, retryable = self._outcome(response, error)
+                self.concurrency.release(overloaded)
+            self._count(requests=1)
+            delay = self._retry_delay(attempt, response, deadline) if retryable else None
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response  # type: ignore
+            logger.info(f"LLM request failed ({error or response.status_code}), retry in {delay:.1f}s")  # type: ignore
+            self._count(retries=1)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+
+# one limiter per endpoint and settings, shared by the agents of a process
+_rate_limiters: Dict[Tuple, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(end_point: str, **kwargs: Any) -> RateLimiter:
+    key = (end_point, tuple(sorted(kwargs.items())))
+    with _rate_limiters_lock:
+        if key not in _rate_limiters:
+            _rate_limiters[key] = RateLimiter(**kwargs)
+        return _rate_limiters[key]
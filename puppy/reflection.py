@@ -1,14 +1,18 @@
 # sourcery skip: dont-import-test-modules
 from rich import print
+import asyncio
 import logging
+import functools
+from concurrent.futures import Executor
 import guardrails as gd
 from datetime import date
 from .run_type import RunMode
 from pydantic import BaseModel, Field
 from httpx import HTTPStatusError
 from guardrails.validators import ValidChoices
-from typing import List, Callable, Dict, Union, Any, Tuple
+from typing import List, Awaitable, Callable, Dict, Union, Any, Tuple
 from .chat import LongerThanContextError
+from .llm_cache import LLMCacheMissError
 from .prompts import (
     short_memory_id_desc,
     mid_memory_id_desc,
@@ -351,12 +355,10 @@ def _test_response_model_invest_info(
     return response_model, investment_info
 
 
-def trading_reflection(
+def _reflection_guard(
     cur_date: date,
-    endpoint_func: Callable[[str], str],
     symbol: str,
     run_mode: RunMode,
-    logger: logging.Logger,
     momentum: Union[int, None] = None,
     future_record: Union[Dict[str, float | str], None] = None,
     short_memory: Union[List[str], None] = None,
@@ -367,7 +369,7 @@ def trading_reflection(
     long_memory_id: Union[List[int], None] = None,
     reflection_memory: Union[List[str], None] = None,
     reflection_memory_id: Union[List[int], None] = None,
-) -> Dict[str, Any]:
+) -> Tuple[gd.Guard, Dict[str, str]]:
     # format memories
     (
         short_memory,
@@ -424,53 +426,166 @@ def trading_reflection(
     guard = gd.Guard.from_pydantic(
         output_class=response_model, prompt=cur_prompt, num_reasks=1
     )
+    # complete_json_suffix_v2 = 'Your output should strictly conform to the following JSON format without any additional contents: {{"summary_reason": string, "short_memory_index": number, "middle_memory_index": number, "long_memory_index": number, "reflection_memory_index": number}}'
+    complete_json_suffix_v2 = (
+        'Your output should strictly conform to the following JSON format without any additional contents: '
+        '{{"summary_reason": "Example explanation", '
+        '"short_memory_index": 0, '
+        '"middle_memory_index": 1, '
+        '"long_memory_index": 2, '
+        '"reflection_memory_index": 3}}')
+    prompt_params = {
+        "investment_info": investment_info,
+        "complete_json_suffix_v2": complete_json_suffix_v2,
+    }
+    return guard, prompt_params
+
+
+def _reflection_result(
+    guard: gd.Guard,
+    validated_outcomes: Any,
+    symbol: str,
+    run_mode: RunMode,
+    logger: logging.Logger,
+    echo_raw_outputs: bool = True,
+) -> Dict[str, Any]:
+    # 🔍 Inspect raw outputs from LLM before Guardrails validation
+    # concurrent reflections would interleave on stdout and overwrite the file, they
+    # only go to the logger
+    if echo_raw_outputs and guard.history and guard.history[0].raw_outputs:
+        print("🧠 RAW LLM OUTPUT:")
+        for i, raw_output in enumerate(guard.history[0].raw_outputs):
+            print(f"\n--- Raw Output {i} ---\n{raw_output}\n")
+
+        # Optional: write to file
+        with open("raw_llm_reflection_output.txt", "w", encoding="utf-8") as f:
+            for i, raw_output in enumerate(guard.history[0].raw_outputs):
+                f.write(f"\n--- Raw Output {i} ---\n{raw_output}\n")
+    
+    logger.info("Guardrails Raw LLM Outputs")
+    for i, o in enumerate(guard.history[0].raw_outputs):
+        logger.info(f"Reask {i}")
+        logger.info(o)
+        logger.info("\n\n")
+    # print(guard.history.last.tree)
+    if (validated_outcomes.validated_output is None) or (
+        not isinstance(validated_outcomes.validated_output, dict)
+    ):
+        logger.info(f"reflection failed for {symbol}")
+        if run_mode == RunMode.Train:
+            return {"summary_reason": validated_outcomes.__dict__['reask'].__dict__['fail_results'][0].__dict__['error_message'], "short_memory_index": None, "middle_memory_index": None, "long_memory_index": None, "reflection_memory_index": None}
+        else:
+            return {"investment_decision" : "hold", "summary_reason": validated_outcomes.__dict__['reask'].__dict__['fail_results'][0].__dict__['error_message'], "short_memory_index": None, "middle_memory_index": None, "long_memory_index": None, "reflection_memory_index": None}
+    return _delete_placeholder_info(validated_outcomes.validated_output)
+
+
+def _reflection_error(e: Exception, logger: logging.Logger) -> Dict[str, Any]:
+    if isinstance(e.__context__, LongerThanContextError):
+        raise LongerThanContextError from e
+    if isinstance(e.__context__, LLMCacheMissError):
+        # a cache-only run must not silently fall back to an empty reflection
+        raise e.__context__
+    logger.info("Wrong again!!!!!")
+    logger.error(e)
+    return _delete_placeholder_info({})
+
+
+def trading_reflection(
+    cur_date: date,
+    endpoint_func: Callable[[str], str],
+    symbol: str,
+    run_mode: RunMode,
+    logger: logging.Logger,
+    momentum: Union[int, None] = None,
+    future_record: Union[Dict[str, float | str], None] = None,
+    short_memory: Union[List[str], None] = None,
+    short_memory_id: Union[List[int], None] = None,
+    mid_memory: Union[List[str], None] = None,
+    mid_memory_id: Union[List[int], None] = None,
+    long_memory: Union[List[str], None] = None,
+    long_memory_id: Union[List[int], None] = None,
+    reflection_memory: Union[List[str], None] = None,
+    reflection_memory_id: Union[List[int], None] = None,
+) -> Dict[str, Any]:
+    guard, prompt_params = _reflection_guard(
+        cur_date=cur_date,
+        symbol=symbol,
+        run_mode=run_mode,
+        momentum=momentum,
+        future_record=future_record,
+        short_memory=short_memory,
+        short_memory_id=short_memory_id,
+        mid_memory=mid_memory,
+        mid_memory_id=mid_memory_id,
+        long_memory=long_memory,
+        long_memory_id=long_memory_id,
+        reflection_memory=reflection_memory,
+        reflection_memory_id=reflection_memory_id,
+    )
+    try:
+        validated_outcomes = guard(endpoint_func, prompt_params=prompt_params)
+        return _reflection_result(guard, validated_outcomes, symbol, run_mode, logger)
+    except Exception as e:
+        return _reflection_error(e, logger)
+
+
+async def async_trading_reflection(
+    cur_date: date,
+    endpoint_func: Callable[..., Awaitable[str]],
+    symbol: str,
+    run_mode: RunMode,
+    logger: logging.Logger,
+    momentum: Union[int, None] = None,
+    future_record: Union[Dict[str, float | str], None] = None,
+    short_memory: Union[List[str], None] = None,
+    short_memory_id: Union[List[int], None] = None,
+    mid_memory: Union[List[str], None] = None,
+    mid_memory_id: Union[List[int], None] = None,
+    long_memory: Union[List[str], None] = None,
+    long_memory_id: Union[List[int], None] = None,
+    reflection_memory: Union[List[str], None] = None,
+    reflection_memory_id: Union[List[int], None] = None,
+    executor: Union[Executor, None] = None,
+) -> Dict[str, Any]:
+    """
+    trading_reflection with a coroutine endpoint such as
+    ChatOpenAICompatible.async_guardrail_endpoint(), for drivers that keep several
+    reflections in flight on one event loop. This is not an async rewrite with
+    trading_reflection as a wrapper: Guardrails runs its validate/reask loop
+    synchronously, so the guard runs in a thread of `executor` (the loop's default
+    executor when None) and each LLM call it makes is sent back to this event loop.
+    The executor's size, not the event loop, bounds how many reflections are in
+    flight. Raw LLM outputs go to the logger only.
+    """
+    guard, prompt_params = _reflection_guard(
+        cur_date=cur_date,
+        symbol=symbol,
+        run_mode=run_mode,
+        momentum=momentum,
+        future_record=future_record,
+        short_memory=short_memory,
+        short_memory_id=short_memory_id,
+        mid_memory=mid_memory,
+        mid_memory_id=mid_memory_id,
+        long_memory=long_memory,
+        long_memory_id=long_memory_id,
+        reflection_memory=reflection_memory,
+        reflection_memory_id=reflection_memory_id,
+    )
+    loop = asyncio.get_running_loop()
+
+    def sync_endpoint_func(input: str, **kwargs) -> str:
+        return asyncio.run_coroutine_threadsafe(
+            endpoint_func(input, **kwargs), loop
+        ).result()
 
     try:
-        # , validated_output
-        # complete_json_suffix_v2 = 'Your output should strictly conform to the following JSON format without any additional contents: {{"summary_reason": string, "short_memory_index": number, "middle_memory_index": number, "long_memory_index": number, "reflection_memory_index": number}}'
-        complete_json_suffix_v2 = (
-    'Your output should strictly conform to the following JSON format without any additional contents: '
-    '{{"summary_reason": "Example explanation", '
-    '"short_memory_index": 0, '
-    '"middle_memory_index": 1, '
-    '"long_memory_index": 2, '
-    '"reflection_memory_index": 3}}')
-
-        validated_outcomes = guard(
-            endpoint_func,
-            prompt_params={"investment_info": investment_info,
-                           "complete_json_suffix_v2": complete_json_suffix_v2},
+        validated_outcomes = await loop.run_in_executor(
+            executor,
+            functools.partial(guard, sync_endpoint_func, prompt_params=prompt_params),
+        )
+        return _reflection_result(
+            guard, validated_outcomes, symbol, run_mode, logger, echo_raw_outputs=False
         )
-        # 🔍 Inspect raw outputs from LLM before Guardrails validation
-        if guard.history and guard.history[0].raw_outputs:
-            print("🧠 RAW LLM OUTPUT:")
-            for i, raw_output in enumerate(guard.history[0].raw_outputs):
-                print(f"\n--- Raw Output {i} ---\n{raw_output}\n")
-
-            # Optional: write to file
-            with open("raw_llm_reflection_output.txt", "w", encoding="utf-8") as f:
-                for i, raw_output in enumerate(guard.history[0].raw_outputs):
-                    f.write(f"\n--- Raw Output {i} ---\n{raw_output}\n")
-        
-        logger.info("Guardrails Raw LLM Outputs")
-        for i, o in enumerate(guard.history[0].raw_outputs):
-            logger.info(f"Reask {i}")
-            logger.info(o)
-            logger.info("\n\n")
-        # print(guard.history.last.tree)
-        if (validated_outcomes.validated_output is None) or (
-            not isinstance(validated_outcomes.validated_output, dict)
-        ):
-            logger.info(f"reflection failed for {symbol}")
-            if run_mode == RunMode.Train:
-                return {"summary_reason": validated_outcomes.__dict__['reask'].__dict__['fail_results'][0].__dict__['error_message'], "short_memory_index": None, "middle_memory_index": None, "long_memory_index": None, "reflection_memory_index": None}
-            else:
-                return {"investment_decision" : "hold", "summary_reason": validated_outcomes.__dict__['reask'].__dict__['fail_results'][0].__dict__['error_message'], "short_memory_index": None, "middle_memory_index": None, "long_memory_index": None, "reflection_memory_index": None}
-        return _delete_placeholder_info(validated_outcomes.validated_output)
-
     except Exception as e:
-        if isinstance(e.__context__, LongerThanContextError):
-            raise LongerThanContextError from e
-        logger.info("Wrong again!!!!!")
-        logger.error(e)
-        return _delete_placeholder_info({})
+        return _reflection_error(e, logger)
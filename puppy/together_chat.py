@@ -1,9 +1,21 @@
 # together_chat_client.py
 import os
 import httpx
+from typing import Union, Dict, Any
 
 class TogetherChat:
-    def __init__(self, model: str, endpoint: str = None, api_key: str = None):
+    """
+    Together chat completions client. Pass `client` to share a pooled httpx.Client,
+    ChatOpenAICompatible does so and posts the payload from `build_payload` itself.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        endpoint: str = None,
+        api_key: str = None,
+        client: Union[httpx.Client, None] = None,
+    ):
         self.api_key = api_key or os.environ.get("TOGETHER_API_KEY", "").strip()
         if not self.api_key:
             raise ValueError("No Together API key provided!")
@@ -14,9 +26,10 @@ class TogetherChat:
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        self.client = client if client is not None else httpx.Client(timeout=60)
 
-    def get_completion(self, messages: list, **kwargs) -> str:
-        payload = {
+    def build_payload(self, messages: list, **kwargs) -> Dict[str, Any]:
+        return {
             "model": self.model,
             "messages": messages,
             "temperature": kwargs.get("temperature", 0.7),
@@ -24,15 +37,21 @@ class TogetherChat:
             "max_tokens": kwargs.get("max_tokens", 1024),
         }
 
-        response = httpx.post(self.endpoint, headers=self.headers, json=payload, timeout=60)
+    @staticmethod
+    def parse_response(response: httpx.Response) -> str:
+        return response.json()["choices"][0]["message"]["content"]
+
+    def get_completion(self, messages: list, **kwargs) -> str:
+        payload = self.build_payload(messages, **kwargs)
+
+        response = self.client.post(self.endpoint, headers=self.headers, json=payload)
 
         if response.status_code == 401:
             raise RuntimeError("Unauthorized: Check your Together API key.")
         if response.status_code != 200:
             raise RuntimeError(f"API call failed: {response.status_code} - {response.text}")
 
-        data = response.json()
-        return data["choices"][0]["message"]["content"]
+        return self.parse_response(response)
 
 if __name__ == "__main__":
     import sys
@@ -0,0 +1,147 @@
+import os
+import time
+import logging
+import threading
+import subprocess
+from abc import ABC, abstractmethod
+from typing import List, Dict, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+
+class TokenProvider(ABC):
+    """
+    Bearer token source for LLM endpoints. The token is cached with its expiry and
+    fetched again on a background timer `refresh_margin_seconds` before it lapses, so
+    requests never wait for a refresh unless it failed. Subclasses implement
+    `fetch_token`.
+    """
+
+    def __init__(self, refresh_margin_seconds: float = 300.0, retry_seconds: float = 30.0) -> None:
+        self.refresh_margin = refresh_margin_seconds
+        self.retry_seconds = retry_seconds
+        self.fetch_count = 0
+        self._token: Union[str, None] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._timer: Union[threading.Timer, None] = None
+
+    @abstractmethod
+    def fetch_token(self) -> Tuple[str, float]:
+        """Returns a fresh token and its lifetime in seconds."""
+        pass
+
+    def _refresh(self) -> None:
+        token, lifetime = self.fetch_token()
+        self.fetch_count += 1
+        self._token = token
+        self._expires_at = time.time() + lifetime
+        # short-lived tokens are refreshed halfway through
+        self._schedule(max(lifetime / 2, lifetime - self.refresh_margin))
+
+    def _schedule(self, delay: float) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self) -> None:
+        with self._lock:
+            try:
+                self._refresh()
+            except Exception as e:
+                # the cached token may still be valid, try again shortly
+                logger.warning(f"Token refresh failed: {e}")
+                self._schedule(self.retry_seconds)
+
+    def get_token(self) -> str:
+        with self._lock:
+            if (self._token is None) or (time.time() >= self._expires_at):
+                self._refresh()
+            return self._token  # type: ignore
+
+    def invalidate(self) -> None:
+        """Drops the cached token, e.g. after the endpoint rejected it."""
+        with self._lock:
+            self._token = None
+
+    def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+
+
+class GcloudTokenProvider(TokenProvider):
+    """
+    Access token from `gcloud auth print-access-token`. gcloud does not report the
+    expiry, Google access tokens live for an hour.
+    """
+
+    def __init__(
+        self,
+        command: Union[List[str], None] = None,
+        lifetime_seconds: float = 3600.0,
+        **kwargs,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.command = (
+            ["gcloud", "auth", "print-access-token"] if command is None else command
+        )
+        self.lifetime = lifetime_seconds
+
+    def fetch_token(self) -> Tuple[str, float]:
+        proc_result = subprocess.run(
+            self.command, capture_output=True, text=True, check=True
+        )
+        return proc_result.stdout.strip(), self.lifetime
+
+
+class FileTokenProvider(TokenProvider):
+    """
+    Token read from a text file, for offline tests or tokens minted by another process.
+    The file is read again when it changes or after `lifetime_seconds`.
+    """
+
+    def __init__(self, path: str, lifetime_seconds: float = 3600.0, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.path = path
+        self.lifetime = lifetime_seconds
+        self._mtime: Union[float, None] = None
+
+    def fetch_token(self) -> Tuple[str, float]:
+        self._mtime = os.path.getmtime(self.path)
+        with open(self.path, "r") as f:
+            return f.read().strip(), self.lifetime
+
+    def get_token(self) -> str:
+        if (self._mtime is not None) and (os.path.getmtime(self.path) != self._mtime):
+            self.invalidate()
+        return super().get_token()
+
+
+# one provider per source, so re-created agents (e.g. load_checkpoint) reuse the token
+_token_providers: Dict[Tuple, TokenProvider] = {}
+_token_providers_lock = threading.Lock()
+
+
+def get_token_provider(
+    token_file: Union[str, None] = None,
+    token_command: Union[List[str], None] = None,
+    token_lifetime_seconds: float = 3600.0,
+) -> TokenProvider:
+    key = (
+        token_file,
+        None if token_command is None else tuple(token_command),
+        token_lifetime_seconds,
+    )
+    with _token_providers_lock:
+        if key not in _token_providers:
+            if token_file is not None:
+                _token_providers[key] = FileTokenProvider(
+                    token_file, lifetime_seconds=token_lifetime_seconds
+                )
+            else:
+                _token_providers[key] = GcloudTokenProvider(
+                    command=token_command, lifetime_seconds=token_lifetime_seconds
+                )
+        return _token_providers[key]
@@ -58,6 +58,12 @@ def sim_func(
         "--trained-agent-path",
         help="Only used in test mode, the path of trained agent",
     ),
+    env_emb_path: Union[str, None] = typer.Option(
+        None,
+        "-eep",
+        "--env-emb-path",
+        help="Precomputed embeddings of the environment data (see precompute-emb)",
+    ),
 ) -> None:
     # load config
     config = toml.load(config_path)
@@ -86,11 +92,23 @@ def sim_func(
     # create environment
     with open(market_data_info_path, "rb") as f:
         env_data_pkl = pickle.load(f)
+    env_emb_pkl = None
+    if env_emb_path is not None:
+        from puppy.precompute import check_embeddings
+
+        with open(env_emb_path, "rb") as f:
+            env_emb_pkl = pickle.load(f)
+        check_embeddings(
+            env_emb_pkl,
+            config["agent"]["agent_1"]["embedding"]["detail"],
+        )
     environment = MarketEnvironment(
         symbol=config["general"]["trading_symbol"],
         env_data_pkl=env_data_pkl,
         start_date=datetime.strptime(start_time, "%Y-%m-%d").date(),
         end_date=datetime.strptime(end_time, "%Y-%m-%d").date(),
+        env_emb_pkl=env_emb_pkl,
+        env_emb_path=env_emb_path,
     )
     if run_mode_var == RunMode.Train:
         the_agent = LLMAgent.from_config(config)
@@ -103,7 +121,7 @@ def sim_func(
         the_agent.counter += 1
         market_info = environment.step()
         logger.info(f"Date {market_info[0]}")
-        logger.info(f"Record {market_info[-2]}")
+        logger.info(f"Record {market_info[5]}")
         if market_info[-1]:  # if done break
             break
         the_agent.step(market_info=market_info, run_mode=run_mode_var)  # type: ignore
@@ -114,6 +132,7 @@ def sim_func(
     # save result after finish
     the_agent.save_checkpoint(path=result_path, force=True)
     environment.save_checkpoint(path=result_path, force=True)
+    the_agent.close()
 
 
 @app.command(
@@ -189,6 +208,244 @@ def sim_checkpoint(
     # save result after finish
     the_agent.save_checkpoint(path=result_path, force=True)
     environment.save_checkpoint(path=result_path, force=True)
+    the_agent.close()
+
+
+@app.command(
+    "precompute-emb",
+    help="Embed the news and filings of the environment data ahead of the simulation",
+    rich_help_panel="Data",
+)
+def precompute_emb_func(
+    market_data_info_path: str = typer.Option(
+        os.path.join("data", "03_model_input", "amzn.pkl"),
+        "-mdp",
+        "--market-data-path",
+        help="The environment data pickle path",
+    ),
+    start_time: Union[str, None] = typer.Option(
+        None, "-st", "--start-time", help="The start time, defaults to the first date"
+    ),
+    end_time: Union[str, None] = typer.Option(
+        None, "-et", "--end-time", help="The end time, defaults to the last date"
+    ),
+    config_path: str = typer.Option(
+        os.path.join("config", "amzn_tgi_config.toml"),
+        "-cp",
+        "--config-path",
+        help="config file path",
+    ),
+    output_path: Union[str, None] = typer.Option(
+        None,
+        "-op",
+        "--output-path",
+        help="Where to save the embeddings, defaults to <market data path>_emb.pkl",
+    ),
+) -> None:
+    import torch
+    from puppy.precompute import precompute_embeddings
+
+    # embedding is the only work here, let torch use every core
+    torch.set_num_threads(os.cpu_count() or 1)
+    config = toml.load(config_path)
+    with open(market_data_info_path, "rb") as f:
+        env_data_pkl = pickle.load(f)
+    env_emb_pkl = precompute_embeddings(
+        env_data_pkl=env_data_pkl,
+        emb_config=config["agent"]["agent_1"]["embedding"]["detail"],
+        start_date=datetime.strptime(start_time, "%Y-%m-%d").date()
+        if start_time
+        else None,
+        end_date=datetime.strptime(end_time, "%Y-%m-%d").date() if end_time else None,
+    )
+    if output_path is None:
+        output_path = f"{os.path.splitext(market_data_info_path)[0]}_emb.pkl"
+    with open(output_path, "wb") as f:
+        pickle.dump(env_emb_pkl, f)
+
+
+@app.command(
+    "emb-server",
+    help="Serve the configured embedding model to local simulations",
+    rich_help_panel="Data",
+)
+def emb_server_func(
+    config_path: str = typer.Option(
+        os.path.join("config", "amzn_tgi_config.toml"),
+        "-cp",
+        "--config-path",
+        help="config file path",
+    ),
+    host: str = typer.Option("127.0.0.1", "--host", help="Address to listen on"),
+    port: int = typer.Option(8765, "--port", help="Port to listen on"),
+    max_batch_docs: int = typer.Option(
+        64, "--max-batch-docs", help="Most texts embedded in one batch"
+    ),
+    max_wait_ms: float = typer.Option(
+        5.0, "--max-wait-ms", help="How long a batch waits for more requests"
+    ),
+) -> None:
+    from puppy.embedding_server import EmbeddingServer
+
+    config = toml.load(config_path)
+    emb_config = dict(config["agent"]["agent_1"]["embedding"]["detail"])
+    # the server embeds itself, clients point server_url at it
+    emb_config.pop("server_url", None)
+    server = EmbeddingServer(
+        emb_config,
+        host=host,
+        port=port,
+        max_batch_docs=max_batch_docs,
+        max_wait_ms=max_wait_ms,
+    )
+    print(f"Embedding server listening on http://{host}:{port}")
+    server.serve_forever()
+
+
+@app.command(
+    "emb-parity",
+    help="Check that the configured ONNX embedding backend stays close to PyTorch",
+    rich_help_panel="Data",
+)
+def emb_parity_func(
+    market_data_info_path: str = typer.Option(
+        os.path.join("data", "03_model_input", "amzn.pkl"),
+        "-mdp",
+        "--market-data-path",
+        help="The environment data pickle path, its news and filings are the sample texts",
+    ),
+    config_path: str = typer.Option(
+        os.path.join("config", "amzn_tgi_config.toml"),
+        "-cp",
+        "--config-path",
+        help="config file path",
+    ),
+    n_texts: int = typer.Option(64, "--n-texts", help="Number of sample texts"),
+    min_cosine: float = typer.Option(
+        0.99, "--min-cosine", help="Lowest cosine similarity allowed per text"
+    ),
+) -> None:
+    import importlib.util
+    from puppy.embedding import check_backend_parity
+
+    config = toml.load(config_path)
+    emb_config = dict(config["agent"]["agent_1"]["embedding"]["detail"])
+    # compare the local backends, not a server
+    emb_config.pop("server_url", None)
+    if emb_config.get("backend", "torch") == "torch":
+        print("The config uses the torch backend, there is nothing to compare")
+        raise typer.Exit()
+    if importlib.util.find_spec("onnxruntime") is None:
+        print("onnxruntime is not installed, skipping the parity check")
+        raise typer.Exit()
+    with open(market_data_info_path, "rb") as f:
+        env_data_pkl = pickle.load(f)
+    texts = []
+    for cur_date in sorted(env_data_pkl):
+        for kind in ["filing_k", "filing_q", "news"]:
+            for content in env_data_pkl[cur_date].get(kind, {}).values():
+                texts.extend([content] if isinstance(content, str) else content)
+    texts = [t for t in texts if t][:n_texts]
+    try:
+        worst = check_backend_parity(emb_config, texts, min_cosine=min_cosine)
+    except ValueError as e:
+        print(e)
+        raise typer.Exit(code=1)
+    print(f"Lowest cosine similarity to torch over {len(texts)} texts: {worst:.4f}")
+
+
+@app.command(
+    "vector-report",
+    help="Recall against memory use of vector storage settings for a saved memory layer",
+    rich_help_panel="Data",
+)
+def vector_report_func(
+    memory_path: str = typer.Option(
+        os.path.join(
+            "data", "06_train_checkpoint", "agent_1", "brain", "long_term_memory"
+        ),
+        "-mp",
+        "--memory-path",
+        help="A saved memory layer of a brain checkpoint",
+    ),
+    top_k: int = typer.Option(5, "-k", "--top-k", help="Recall at k"),
+) -> None:
+    import faiss
+    import numpy as np
+    from puppy.memory_index import vector_storage_report
+
+    with open(os.path.join(memory_path, "universe_index.pkl"), "rb") as f:
+        universe = pickle.load(f)
+    emb_list = []
+    for cur_symbol, cur_record in universe.items():
+        cur_memory = cur_record["score_memory"]
+        if isinstance(cur_memory, list):
+            # checkpoints written before the columnar store only have the vectors in the index
+            cur_index = faiss.read_index(os.path.join(memory_path, f"{cur_symbol}.index"))
+            inner_index = faiss.downcast_index(cur_index.index)
+            emb_list.append(inner_index.reconstruct_n(0, inner_index.ntotal))
+        else:
+            emb_list.append(cur_memory.emb_rows(cur_memory.live_rows()))
+    if not emb_list:
+        print("No vectors in this memory layer")
+        return
+    emb = np.vstack(emb_list)
+    print(f"{len(emb)} vectors of dimension {emb.shape[1]}")
+    for row in vector_storage_report(emb, top_k=top_k):
+        print(
+            f"{row['storage']:>8} dim={row['dim']:<5} recall@{top_k}={row[f'recall@{top_k}']:.3f} "
+            f"{row['bytes_per_vector']} B/vector {row['total_mb']:.2f} MB"
+        )
+
+
+@app.command(
+    "llm-stub-server",
+    help="Serve canned reflections in place of the LLM endpoint for offline load tests",
+    rich_help_panel="Simulation",
+)
+def llm_stub_server_func(
+    host: str = typer.Option("127.0.0.1", "--host", help="Address to listen on"),
+    port: int = typer.Option(8766, "--port", help="Port to listen on"),
+    latency_ms: float = typer.Option(
+        0.0, "--latency-ms", help="Response latency, the mean or median of a distribution"
+    ),
+    latency_dist: str = typer.Option(
+        "constant", "--latency-dist", help="constant, exponential or lognormal"
+    ),
+    latency_sigma: float = typer.Option(
+        0.5, "--latency-sigma", help="Spread of the lognormal latency"
+    ),
+    error_rate: float = typer.Option(
+        0.0, "--error-rate", help="Share of requests answered with 500"
+    ),
+    context_error_rate: float = typer.Option(
+        0.0, "--context-error-rate", help="Share of requests answered with the 422 context error"
+    ),
+    max_prompt_chars: Union[int, None] = typer.Option(
+        None, "--max-prompt-chars", help="Answer longer prompts with the 422 context error"
+    ),
+    seed: int = typer.Option(0, "--seed", help="Random seed"),
+) -> None:
+    from puppy.llm_stub_server import StubLLMServer
+
+    server = StubLLMServer(
+        host=host,
+        port=port,
+        latency_ms=latency_ms,
+        latency_dist=latency_dist,
+        latency_sigma=latency_sigma,
+        error_rate=error_rate,
+        context_error_rate=context_error_rate,
+        max_prompt_chars=max_prompt_chars,
+        seed=seed,
+    )
+    # point [chat] end_point at it with a gpt-* or tgi model,
+    # e.g. http://127.0.0.1:8766/v1/chat/completions
+    print(f"Stub LLM server listening on http://{host}:{port}, stats at /stats")
+    try:
+        server.serve_forever()
+    finally:
+        print(server.stats())
 
 
 if __name__ == "__main__":